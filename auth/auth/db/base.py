@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db.backends.postgresql import base
+
+from .pool import ConnectionPool, get_pool
+
+
+def pool_size() -> int:
+    # the connections of an instance are shared out among its worker processes, each using one per request thread
+    share = settings.DATABASE_POOL['MAX_CONNECTIONS'] // settings.DATABASE_POOL['WORKERS']
+    return max(1, min(share, settings.DATABASE_POOL['THREADS']))
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The postgresql backend, taking its connections from a `ConnectionPool` of the process instead of opening one
+    per request: closing a connection, as Django does at the end of each request with CONN_MAX_AGE = 0, returns
+    it to the pool, unless it is closed within an atomic block.
+    """
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(tuple(sorted(conn_params.items())), lambda: ConnectionPool(
+            connect=lambda: base.Database.connect(**conn_params),
+            size=pool_size(),
+            timeout=settings.DATABASE_POOL['TIMEOUT'],
+            check_interval=settings.DATABASE_POOL['CHECK_INTERVAL'],
+        ))
+        connection = self.pool.checkout()
+
+        # as the postgresql backend does for a new connection
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level', connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                # closed in an atomic block, the connection stays set on the wrapper until the block exits
+                # (closed_in_transaction): it cannot be handed out to another thread meanwhile
+                if self.in_atomic_block:
+                    self.pool.discard(self.connection)
+                else:
+                    self.pool.checkin(self.connection)
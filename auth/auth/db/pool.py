@@ -0,0 +1,170 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+
+from auth.metrics import LatencyHistogram
+
+
+class ConnectionPool:
+    """
+    Up to `size` psycopg2 connections of a process, handed out by `checkout` and returned by `checkin` (or closed
+    by `discard`).
+
+    Idle connections are reused most recently returned first, and pinged before being handed out once they have
+    been idle for `check_interval` seconds; broken ones are replaced. A checkout waits up to `timeout` seconds for
+    a connection when all of them are in use, then fails with `psycopg2.OperationalError`.
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int, timeout: float, check_interval: float) -> None:
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.check_interval = check_interval
+
+        self._cond = threading.Condition()
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self._open = 0
+
+        self._counters = {'checkouts': 0, 'created': 0, 'discarded': 0, 'waits': 0, 'timeouts': 0}
+        self.wait = LatencyHistogram()
+
+    def checkout(self) -> Any:
+        started = time.monotonic()
+
+        while True:
+            entry = self._take(started)
+            if entry is None:
+                return self._create()
+
+            conn, returned_at = entry
+            if self._healthy(conn, returned_at):
+                return conn
+            self.discard(conn)
+
+    def _take(self, started: float) -> Any:
+        # an idle connection, or None once a slot for a new one is reserved
+        with self._cond:
+            waited = False
+            while not self._idle and self._open >= self.size:
+                remaining = started + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise psycopg2.OperationalError(
+                        f'No database connection available within {self.timeout}s, all {self.size} in use.')
+                waited = True
+                self._cond.wait(remaining)
+
+            self._counters['checkouts'] += 1
+            self._counters['waits'] += waited
+            self.wait.observe(time.monotonic() - started)
+
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+            return None
+
+    def _create(self) -> Any:
+        try:
+            conn = self.connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._counters['created'] += 1
+        return conn
+
+    def _healthy(self, conn: Any, returned_at: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except psycopg2.Error:
+            return False
+        return True
+
+    def discard(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+        with self._cond:
+            self._open -= 1
+            self._counters['discarded'] += 1
+            self._cond.notify()
+
+    def checkin(self, conn: Any) -> None:
+        status = extensions.TRANSACTION_STATUS_UNKNOWN if conn.closed else conn.get_transaction_status()
+
+        # connections are only reused outside of any transaction, with no query running
+        if status in (extensions.TRANSACTION_STATUS_INTRANS, extensions.TRANSACTION_STATUS_INERROR):
+            try:
+                conn.rollback()
+                status = conn.get_transaction_status()
+            except psycopg2.Error:
+                status = extensions.TRANSACTION_STATUS_UNKNOWN
+
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            self.discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self.discard(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._counters,
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                'wait': self.wait.snapshot(),
+            }
+
+
+_lock = threading.Lock()
+_pools: Dict[Tuple, ConnectionPool] = {}
+_pid = os.getpid()
+# connections of the pools of a parent process, kept referenced in a forked child: closing them (or letting them be
+# garbage collected) would end the parent's sessions
+_inherited: List[ConnectionPool] = []
+
+
+def get_pool(key: Tuple, factory: Callable[[], ConnectionPool]) -> ConnectionPool:
+    global _pid
+
+    with _lock:
+        if os.getpid() != _pid:
+            _pid = os.getpid()
+            _inherited.extend(_pools.values())
+            _pools.clear()
+
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = factory()
+        return pool
+
+
+def pool_stats() -> List[Dict[str, Any]]:
+    with _lock:
+        return [pool.stats() for pool in _pools.values()]
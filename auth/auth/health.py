@@ -0,0 +1,89 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import jwt
+from django.conf import settings
+from django.db import connection
+
+from auth.redis_client import get_redis
+from jwt_utils.keys import keyring
+
+
+logger = logging.getLogger(__name__)
+
+Report = Dict[str, Any]
+
+
+def check_postgres() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def check_redis() -> None:
+    # the celery broker as well
+    get_redis().ping()
+
+
+def check_keys() -> None:
+    # signs with the signing key and verifies with its public key, as tokens are
+    algorithm, public_key = keyring.public_keys[keyring.kid]
+    jwt.decode(jwt.encode({}, keyring.private_key, keyring.algorithm), public_key, algorithms=[algorithm])
+
+
+class HealthCheck:
+    """
+    Readiness of the process, as the results of `probes`, each a function raising when its dependency is not
+    available.
+
+    Results are kept for `ttl` seconds and probes run one at a time, so that however often the load balancer
+    asks, every dependency sees at most one probe per `ttl` from each process. Callers arriving while probes
+    run are given the previous results, when there are any, instead of waiting for them.
+    """
+
+    def __init__(self, probes: Dict[str, Callable[[], None]], ttl: float) -> None:
+        self.probes = probes
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._report: Optional[Report] = None
+        self._expires = 0.0
+
+    def _probe(self, name: str, probe: Callable[[], None]) -> Tuple[str, Dict[str, Any]]:
+        started = time.monotonic()
+        try:
+            probe()
+        except Exception as exc:
+            logger.warning('Health probe %s failed: %r', name, exc)
+            result: Dict[str, Any] = {'ok': False, 'error': exc.__class__.__name__}
+        else:
+            result = {'ok': True}
+
+        result['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+        return name, result
+
+    def _run(self) -> Report:
+        checks = dict(self._probe(name, probe) for name, probe in self.probes.items())
+        return {'ok': all(check['ok'] for check in checks.values()), 'checks': checks}
+
+    def report(self) -> Report:
+        if time.monotonic() < self._expires:
+            return self._report  # type: ignore
+
+        if not self._lock.acquire(blocking=self._report is None):
+            return self._report  # type: ignore
+
+        try:
+            if time.monotonic() >= self._expires:
+                self._report = self._run()
+                self._expires = time.monotonic() + self.ttl
+            return self._report  # type: ignore
+        finally:
+            self._lock.release()
+
+
+health_check = HealthCheck(
+    probes={'postgres': check_postgres, 'redis': check_redis, 'keys': check_keys},
+    ttl=settings.HEALTH_CHECK['TTL'],
+)
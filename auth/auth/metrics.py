@@ -0,0 +1,29 @@
+import bisect
+import threading
+from typing import Any, Dict
+
+
+class LatencyHistogram:
+    """
+    Counts of the observed durations per bucket, cumulated since the process started, as shared by the hashing
+    executor (see users.hashing) and the connection pools (see auth.db.pool).
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # seconds
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            self.total += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'buckets': dict(zip([*map(str, self.BUCKETS), '+Inf'], self.counts)),
+                'count': sum(self.counts),
+                'sum': self.total,
+            }
@@ -0,0 +1,22 @@
+from django.db import connections
+from django.urls import get_resolver
+
+
+def warm_up() -> None:
+    """
+    Builds, in the gunicorn master, what every worker would otherwise build on its first requests: the URL
+    resolver, the JWKS document, the JWT claim fields and the dummy password hash; the signing keys were loaded
+    along with the settings. Forked workers share these pages for as long as they are not written to.
+    """
+    from jwt_utils.handlers import jwt_payload_fields
+    from jwt_utils.views import jwks_document
+    from users.hashing import dummy_password
+
+    # populated on first access
+    get_resolver().reverse_dict
+    jwks_document()
+    jwt_payload_fields()
+    dummy_password()
+
+    # no connection of the master is to be inherited by the workers
+    connections.close_all()
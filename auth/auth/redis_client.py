@@ -0,0 +1,29 @@
+import threading
+from typing import Optional
+
+import redis
+from django.conf import settings
+
+
+_lock = threading.Lock()
+_client: Optional[redis.StrictRedis] = None
+
+
+def get_redis() -> redis.StrictRedis:
+    """
+    Process wide client of the service's redis (also the celery broker); redis-py pools its connections.
+    """
+    global _client
+
+    with _lock:
+        if _client is None:
+            _client = redis.StrictRedis(
+                host=settings.REDIS_HOST,
+                port=int(settings.REDIS_PORT),
+                db=int(settings.REDIS_DB_ID),
+                password=settings.REDIS_PASSWORD,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            )
+
+        return _client
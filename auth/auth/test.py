@@ -1,21 +1,467 @@
 import os
+import sys
+import time
+import datetime
+import socket
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import BaseRequestHandler, ThreadingMixIn, TCPServer
+from typing import Dict, List, Optional, Tuple
+from unittest.mock import patch
 
-from rest_framework.test import APITestCase
+import psycopg2
+import redis
+import requests
+from psycopg2 import extensions
+from django.conf import settings
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
 from rest_framework import status
 
+from auth.db.base import pool_size
+from auth.db.pool import ConnectionPool
+from auth.health import HealthCheck, check_keys, check_postgres, check_redis
+from auth.testing import APITestCase, TestCase, benchmark
+from users.models import User
+
 
 class TestStatusApi(APITestCase):
     URL = '/'
     CONTENT_TYPE = 'json'
 
     def setUp(self):
+        super().setUp()
         os.environ['DOCKER_IMAGE_TAG'] = '19.91'
 
     def test_api(self):
         response = self.client.get(self.URL, format=self.CONTENT_TYPE)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(response.data), 5)
         self.assertEqual(response.data['image'], 'auth')
         self.assertEqual(response.data['tag'], os.environ['DOCKER_IMAGE_TAG'])
         self.assertIn('up_time', response.data)
+        self.assertEqual(set(response.data['build']), {'commit', 'date', 'python', 'django'})
+
+    def test_database_pools(self):
+        pool = ConnectionPool(lambda: None, size=2, timeout=1, check_interval=30)
+        pool.wait.observe(0.02)
+
+        with patch('auth.db.pool._pools', {('pooled',): pool}):
+            response = self.client.get(self.URL, format=self.CONTENT_TYPE)
+
+        [stats] = response.data['database_pools']
+        self.assertEqual((stats['size'], stats['in_use']), (2, 0))
+        self.assertEqual(stats['wait']['count'], 1)
+
+    def test_up_time_past_a_day(self):
+        with override_settings(START_DATETIME=datetime.datetime.now() - datetime.timedelta(days=1, hours=2)):
+            response = self.client.get(self.URL, format=self.CONTENT_TYPE)
+
+        self.assertTrue(response.data['up_time'].startswith('26:00:'))
+
+
+class TestHealthApi(APITestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = patch('auth.views.health_check', self.health_check())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def health_check(ttl: float = 60, **probes) -> HealthCheck:
+        return HealthCheck({'postgres': check_postgres, 'redis': check_redis, 'keys': check_keys, **probes}, ttl)
+
+    def test_live(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/health/live')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_ready(self):
+        response = self.client.get('/health/ready')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['ok'])
+        self.assertEqual({name: check['ok'] for name, check in response.data['checks'].items()},
+                         {'postgres': True, 'redis': True, 'keys': True})
+
+    def test_ready_503(self):
+        def redis_down():
+            raise redis.ConnectionError('Connection refused.')
+
+        with patch('auth.views.health_check', self.health_check(redis=redis_down)):
+            response = self.client.get('/health/ready')
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(response.data['ok'])
+        self.assertEqual((response.data['checks']['redis']['ok'], response.data['checks']['redis']['error']),
+                         (False, 'ConnectionError'))
+        self.assertTrue(response.data['checks']['postgres']['ok'])
+
+    def test_cached(self):
+        calls = []
+        health_check = HealthCheck({'probe': lambda: calls.append(1)}, ttl=60)
+
+        for _ in range(10):
+            self.assertTrue(health_check.report()['ok'])
+        self.assertEqual(len(calls), 1)
+
+        health_check.ttl = 0
+        health_check._expires = 0
+        health_check.report()
+        self.assertEqual(len(calls), 2)
+
+    def test_previous_report_while_probing(self):
+        health_check = HealthCheck({'probe': lambda: None}, ttl=0)
+        previous = health_check.report()
+
+        probing, release = threading.Event(), threading.Event()
+
+        def slow_probe():
+            probing.set()
+            release.wait(5)
+
+        health_check.probes = {'probe': slow_probe}
+        thread = threading.Thread(target=health_check.report)
+        thread.start()
+        probing.wait(5)
+
+        # answered right away, from the report of the previous probes
+        self.assertIs(health_check.report(), previous)
+        release.set()
+        thread.join()
+
+
+class TestConnectionPool(TestCase):
+    REQUESTS = 200
+
+    def setUp(self):
+        super().setUp()
+        self.params = connection.get_connection_params()
+
+    def pool(self, size: int = 2, timeout: float = 1, check_interval: float = 30) -> ConnectionPool:
+        pool = ConnectionPool(lambda: psycopg2.connect(**self.params), size, timeout, check_interval)
+        self.addCleanup(pool.close)
+        return pool
+
+    @staticmethod
+    def backend_pid(conn) -> int:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_reuse(self):
+        pool = self.pool()
+
+        conn = pool.checkout()
+        pid = self.backend_pid(conn)
+        pool.checkin(conn)
+
+        self.assertEqual(self.backend_pid(pool.checkout()), pid)
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'], stats['created'], stats['in_use'], stats['idle']), (2, 1, 1, 0))
+
+    def test_checkin_rolls_back(self):
+        pool = self.pool()
+
+        conn = pool.checkout()
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertEqual(conn.get_transaction_status(), extensions.TRANSACTION_STATUS_INTRANS)
+        pool.checkin(conn)
+
+        self.assertEqual(conn.get_transaction_status(), extensions.TRANSACTION_STATUS_IDLE)
+        self.assertIs(pool.checkout(), conn)
+
+        conn.close()
+        pool.checkin(conn)
+        self.assertEqual((pool.stats()['discarded'], pool.stats()['open']), (1, 0))
+
+    def test_health_check(self):
+        pool = self.pool(check_interval=0)
+
+        conn = pool.checkout()
+        pid = self.backend_pid(conn)
+        conn.commit()
+        pool.checkin(conn)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+
+        replacement = pool.checkout()
+        self.assertNotEqual(self.backend_pid(replacement), pid)
+        self.assertEqual((pool.stats()['discarded'], pool.stats()['created']), (1, 2))
+
+    def test_wait_and_timeout(self):
+        pool = self.pool(size=1, timeout=0.2)
+        conn = pool.checkout()
+
+        with self.assertRaises(psycopg2.OperationalError):
+            pool.checkout()
+
+        threading.Timer(0.05, pool.checkin, [conn]).start()
+        self.assertIs(pool.checkout(), conn)
+
+        stats = pool.stats()
+        self.assertEqual((stats['timeouts'], stats['waits'], stats['created']), (1, 1, 1))
+
+    @override_settings(DATABASE_POOL={**settings.DATABASE_POOL, 'MAX_CONNECTIONS': 20, 'WORKERS': 3, 'THREADS': 8})
+    def test_pool_size(self):
+        self.assertEqual(pool_size(), 6)
+
+        with override_settings(DATABASE_POOL={**settings.DATABASE_POOL, 'THREADS': 4}):
+            self.assertEqual(pool_size(), 4)
+
+    def test_closed_in_atomic_block(self):
+        wrapper = load_backend('auth.db').DatabaseWrapper(connection.settings_dict, 'pooled')
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.pool.close)
+        discarded = wrapper.pool.stats()['discarded']
+
+        # as `close_old_connections` does when a request ends within `atomic`
+        wrapper.in_atomic_block = True
+        wrapper.close()
+
+        # still held by the wrapper, so closed rather than returned to the pool
+        self.assertTrue(wrapper.closed_in_transaction)
+        self.assertTrue(wrapper.connection.closed)
+        self.assertEqual(wrapper.pool.stats()['discarded'], discarded + 1)
+        self.assertNotIn(wrapper.connection, [conn for conn, _ in wrapper.pool._idle])
+
+    def _latencies(self, engine: str) -> List[float]:
+        wrapper = load_backend(engine).DatabaseWrapper({**connection.settings_dict, 'ENGINE': engine}, 'benchmark')
+        latencies = []
+
+        # the connection handling of a request, as Django does it with CONN_MAX_AGE = 0, around a `me` lookup
+        for _ in range(self.REQUESTS):
+            started = time.perf_counter()
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT id, uuid, username, email FROM users_user WHERE uuid = %s', ['a' * 32])
+            wrapper.close()
+            latencies.append(time.perf_counter() - started)
+
+        if engine == 'auth.db':
+            wrapper.pool.close()
+        return sorted(latencies)
+
+    @benchmark
+    def test_benchmark(self):
+        results = {}
+        for engine in ('django.db.backends.postgresql', 'auth.db'):
+            latencies = self._latencies(engine)
+            results[engine] = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+        print('\n' + '; '.join(
+            f'{engine}: p50 {p50 * 1000:.2f}ms, p99 {p99 * 1000:.2f}ms' for engine, (p50, p99) in results.items()))
+
+
+class LatencyProxy(ThreadingMixIn, TCPServer):
+    """
+    Forwards TCP connections to `target`, delaying every message of the client by `delay` seconds.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, target, delay):
+        self.target = target
+        self.delay = delay
+
+        class Handler(BaseRequestHandler):
+            def handle(handler):
+                upstream = socket.create_connection(self.target)
+                threading.Thread(target=self.pipe, args=(upstream, handler.request, 0), daemon=True).start()
+                self.pipe(handler.request, upstream, self.delay)
+
+        super().__init__(('127.0.0.1', 0), Handler)
+
+    @staticmethod
+    def pipe(source, destination, delay):
+        try:
+            for data in iter(lambda: source.recv(65536), b''):
+                time.sleep(delay)
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            destination.close()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class GunicornTestCase(TransactionTestCase):
+    AUTH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def serve(self, database_port: int, *args: str,
+              env: Optional[Dict[str, str]] = None) -> Tuple[str, subprocess.Popen]:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        database = connection.settings_dict
+        env = {
+            **os.environ,
+            'POSTGRES_DB': database['NAME'], 'POSTGRES_HOST': '127.0.0.1', 'POSTGRES_PORT': str(database_port),
+            'POSTGRES_USER': database['USER'], 'POSTGRES_PASSWORD': database['PASSWORD'],
+            **(env or {}),
+        }
+        server = subprocess.Popen(
+            # what the gunicorn script runs, with the interpreter of the tests
+            [sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()',
+             *args, '--bind', f'127.0.0.1:{port}', 'auth.wsgi:application'],
+            cwd=self.AUTH_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.addCleanup(server.wait)
+        self.addCleanup(server.terminate)
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return f'http://127.0.0.1:{port}', server
+            except OSError:
+                time.sleep(0.1)
+        raise AssertionError('gunicorn did not start')
+
+
+class TestWorkerClasses(GunicornTestCase):
+    """
+    Benchmark of a single gunicorn worker process, with the sync worker class and with the threaded one of
+    gunicorn.conf.py, serving requests that wait on postgres: each message to the database takes `DELAY` seconds,
+    as over a network.
+    """
+    REQUESTS = 80
+    THREADS = 8
+    DELAY = 0.01
+
+    def setUp(self):
+        User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@foothub.com', password='!') for i in range(10))
+        self.token = User.objects.first().create_jwt()
+
+    def throughput(self, database_port: int, *args: str) -> float:
+        url, _ = self.serve(database_port, '--workers', '1', *args)
+        session = requests.Session()
+        # the test runner allows 'testserver' after the hosts of the settings, the server does not
+        session.headers.update({'Authorization': f'JWT {self.token}', 'Host': settings.ALLOWED_HOSTS[0]})
+
+        def list_users(_):
+            return session.get(f'{url}/users?page_size=5', timeout=30).status_code
+
+        list_users(None)  # warm up
+        with ThreadPoolExecutor(self.THREADS) as clients:
+            started = time.perf_counter()
+            statuses = list(clients.map(list_users, range(self.REQUESTS)))
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual(set(statuses), {200})
+        return self.REQUESTS / elapsed
+
+    @benchmark
+    def test_load(self):
+        database = connection.settings_dict
+        with LatencyProxy((database['HOST'] or 'localhost', int(database['PORT'] or 5432)), self.DELAY) as proxy:
+            port = proxy.server_address[1]
+            # gunicorn.conf.py, read by default, would have a sync worker with several threads run as a gthread one
+            sync = self.throughput(port, '--worker-class', 'sync', '--threads', '1')
+            threaded = self.throughput(port, '--worker-class', 'gthread', '--threads', str(self.THREADS))
+
+        print(f'\n{self.THREADS} concurrent clients of one worker process, {self.DELAY * 1000:.0f}ms to postgres: '
+              f'{sync:.0f} req/s sync, {threaded:.0f} req/s gthread')
+
+
+class TestWebImports(SimpleTestCase):
+    AUTH_DIR = GunicornTestCase.AUTH_DIR
+
+    def test_celery_only_modules(self):
+        # in a fresh interpreter, as the tests import every module
+        script = (
+            'import sys\n'
+            'import django; django.setup()\n'
+            'from django.urls import resolve; resolve("/")\n'
+            'import auth.wsgi\n'
+            'print(*(name for name in ("users.emails", "users.subscribers") if name in sys.modules))\n'
+        )
+        output = subprocess.check_output([sys.executable, '-c', script], cwd=self.AUTH_DIR, env=os.environ)
+        self.assertEqual(output.decode().strip(), '')
+
+
+class TestStartup(GunicornTestCase):
+    """
+    Benchmark of the startup of the application: import time of a web process, and memory of the gunicorn
+    instance of gunicorn.conf.py with its workers forked from a preloaded master and with each worker loading the
+    application itself.
+    """
+    WORKERS = 2
+
+    @benchmark
+    def test_import_time(self):
+        # in a fresh interpreter, timed step by step as python 3.6 has no -X importtime
+        script = (
+            'import time\n'
+            'started = time.perf_counter()\n'
+            'import django; django.setup()\n'
+            'setup = time.perf_counter()\n'
+            'from django.urls import resolve; resolve("/")\n'
+            'urls = time.perf_counter()\n'
+            'import auth.wsgi\n'
+            'wsgi = time.perf_counter()\n'
+            'print(setup - started, urls - setup, wsgi - urls)\n'
+        )
+        output = subprocess.check_output([sys.executable, '-c', script], cwd=self.AUTH_DIR, env=os.environ)
+        setup, urls, wsgi = map(float, output.split())
+
+        print(f'\nweb process imports: {(setup + urls + wsgi) * 1000:.0f}ms, django.setup() {setup * 1000:.0f}ms, '
+              f'url resolution {urls * 1000:.0f}ms, auth.wsgi {wsgi * 1000:.0f}ms')
+
+    @staticmethod
+    def workers(pid: int) -> List[int]:
+        with open(f'/proc/{pid}/task/{pid}/children') as children:
+            return [int(child) for child in children.read().split()]
+
+    @staticmethod
+    def loaded(pid: int) -> bool:
+        # psycopg2 is imported along with the settings, by the master when preloading or by each worker
+        with open(f'/proc/{pid}/maps') as maps:
+            return '_psycopg' in maps.read()
+
+    @staticmethod
+    def pss_kb(pid: int) -> int:
+        # proportional set size: private pages, plus shared ones divided among the processes sharing them
+        with open(f'/proc/{pid}/smaps_rollup') as rollup:
+            return next(int(line.split()[1]) for line in rollup if line.startswith('Pss:'))
+
+    @staticmethod
+    def rss_kb(pid: int) -> int:
+        # resident set size, shared pages counted in full by every process mapping them
+        with open(f'/proc/{pid}/status') as status:
+            return next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+
+    def memory(self, preload: bool) -> Tuple[int, List[int]]:
+        # PSS of the whole instance, RSS of each worker
+        database = connection.settings_dict
+        _, server = self.serve(
+            int(database['PORT'] or 5432), '--config', 'gunicorn.conf.py',
+            env={'WEB_CONCURRENCY': str(self.WORKERS), 'GUNICORN_PRELOAD': 'true' if preload else 'false'})
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            workers = self.workers(server.pid)
+            if len(workers) == self.WORKERS and all(self.loaded(pid) for pid in workers):
+                return sum(self.pss_kb(pid) for pid in [server.pid, *workers]), [self.rss_kb(pid) for pid in workers]
+            time.sleep(0.1)
+        raise AssertionError('gunicorn workers did not load the application')
+
+    @benchmark
+    def test_preload_memory(self):
+        for preload, label in ((True, 'preloaded'), (False, 'loaded by each worker')):
+            pss, rss = self.memory(preload)
+            print(f'\ngunicorn with {self.WORKERS} workers, {label}: {pss / 1024:.1f}MB PSS, '
+                  f'RSS per worker {", ".join(f"{kb / 1024:.1f}MB" for kb in rss)}')
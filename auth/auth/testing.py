@@ -0,0 +1,58 @@
+import os
+from unittest import skipUnless
+from unittest.mock import patch
+
+import fakeredis
+from django import test
+from rest_framework import test as rest_test
+
+from jwt_utils.revocation import RevocationList
+from users.cache import user_cache
+from users.throttling import RateLimiter
+
+
+def benchmark(method):
+    """
+    Marks a test that times code against the wall clock and reports its results: such tests are skipped by the
+    suite, `make benchmark` runs them.
+    """
+    return test.tag('benchmark')(skipUnless(os.getenv('DJANGO_BENCHMARKS') == 'true', 'benchmark')(method))
+
+
+class FakeRedisMixin:
+    """
+    Runs the test against fakeredis, for the redis client of `auth.redis_client` and the revocation list, rate
+    limiter and user cache singletons, so that no state carries over between tests.
+    """
+    REVOCATION_CONFIG = {'capacity': 1000, 'error_rate': 0.001, 'resync_interval': 3600, 'user_retention': 3600}
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeStrictRedis()
+        self.redis.flushall()
+        self.revocations = self.revocation_list()
+
+        self.limiter = RateLimiter(max_local_keys=1000, retry_after=5, client=lambda: self.redis)
+
+        user_cache.local.clear()
+        self.addCleanup(user_cache.local.clear)
+        for target, replacement in (('auth.redis_client._client', self.redis),
+                                    ('users.cache.user_cache._client', lambda: self.redis),
+                                    ('users.cache.user_cache._redis_down_until', None),
+                                    ('jwt_utils.handlers.revocations', self.revocations),
+                                    ('users.views.revocations', self.revocations),
+                                    ('users.throttling.limiter', self.limiter)):
+            patcher = patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def revocation_list(self, **config):
+        return RevocationList(**{**self.REVOCATION_CONFIG, **config}, client=lambda: self.redis)
+
+
+class TestCase(FakeRedisMixin, test.TestCase):
+    pass
+
+
+class APITestCase(FakeRedisMixin, rest_test.APITestCase):
+    pass
@@ -1,9 +1,13 @@
 from django.urls import path, include
 
-from auth.views import status_view
+from auth.views import live_view, ready_view, status_view
+from jwt_utils.views import jwks_view
 
 urlpatterns = [
     path('', status_view),
+    path('health/live', live_view),
+    path('health/ready', ready_view),
     path('jwt/', include('jwt_utils.urls')),
+    path('.well-known/jwks.json', jwks_view),
     path('', include('users.urls'))
 ]
@@ -1,6 +1,8 @@
 import os
 import datetime
+import platform
 
+import django
 from django.conf import settings
 
 from rest_framework.views import APIView
@@ -8,6 +10,9 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
 
+from .db.pool import pool_stats
+from .health import health_check
+
 
 class StatusView(APIView):
     http_method_names = ['get']
@@ -16,7 +21,8 @@ class StatusView(APIView):
     @staticmethod
     def __calculate_up_time():
         delta = datetime.datetime.now() - settings.START_DATETIME
-        hours, remainder = divmod(delta.seconds, 3600)
+        # hours keep counting past a day
+        hours, remainder = divmod(int(delta.total_seconds()), 3600)
         minutes, seconds = divmod(remainder, 60)
 
         return '{:02}:{:02}:{:02}'.format(int(hours), int(minutes), int(seconds))
@@ -27,9 +33,42 @@ class StatusView(APIView):
             data={
                 'image': 'auth',
                 'tag': os.getenv('DOCKER_IMAGE_TAG', 'dev'),
-                'up_time': self.__calculate_up_time()
+                'up_time': self.__calculate_up_time(),
+                'build': {
+                    'commit': os.getenv('GIT_COMMIT', 'unknown'),
+                    'date': os.getenv('BUILD_DATE', 'unknown'),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                },
+                # checkouts and their waits, per pool of this process: none unless the `auth.db` engine is used
+                'database_pools': pool_stats(),
             },
             content_type='application/json')
 
 
+class LiveView(APIView):
+    """
+    Liveness: the process serves requests, whatever the state of its dependencies.
+    """
+    http_method_names = ['get']
+    permission_classes = (AllowAny,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(status=status.HTTP_200_OK, data={'ok': True})
+
+
+class ReadyView(LiveView):
+    """
+    Readiness: postgres, redis and the signing keys are available, as last probed (see auth.health).
+    """
+
+    def get(self, request, *args, **kwargs):
+        report = health_check.report()
+        return Response(
+            status=status.HTTP_200_OK if report['ok'] else status.HTTP_503_SERVICE_UNAVAILABLE,
+            data=report)
+
+
 status_view = StatusView.as_view()
+live_view = LiveView.as_view()
+ready_view = ReadyView.as_view()
@@ -0,0 +1,34 @@
+"""
+gunicorn settings of Dockerfile.app, also read by default by gunicorn started from this directory, see
+http://docs.gunicorn.org/en/19.9.0/settings.html
+
+The application is loaded once, by the master, and the workers are forked from it: they share the memory of
+the imported modules, parsed keys and warmed caches (see `auth.preload`) instead of each building its own.
+"""
+import os
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# requests mostly wait on postgres, redis and password hashing: each worker serves them from several threads;
+# exported for the settings, which size the database pools after them (see DATABASE_POOL)
+workers = int(os.environ.setdefault('WEB_CONCURRENCY', '2'))
+threads = int(os.environ.setdefault('GUNICORN_THREADS', '8'))
+worker_class = 'gthread'
+
+# workers are replaced after a number of requests, spread out so that they are not all replaced at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '1000'))
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true') == 'true'
+
+accesslog = '-'
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+
+    from auth.preload import warm_up
+
+    warm_up()
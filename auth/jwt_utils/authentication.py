@@ -0,0 +1,89 @@
+from typing import Any, Dict
+
+import jwt
+from django.utils.functional import cached_property
+from django.utils.translation import ugettext as _
+from rest_framework import exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+
+from users.cache import user_cache
+from users.models import User
+
+from .handlers import RevokedTokenError
+
+
+class TokenUser:
+    """
+    Request principal built from verified JWT claims.
+
+    The claims issued by `jwt_utils.handlers.jwt_payload_handler` (`uuid`, `username`, `email`) are served
+    straight from the token. Any other attribute (`id`, `email_confirmed`, ...) loads the `User` row once,
+    on first access, through `users.cache`, and is read from it.
+    """
+    is_active = True
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, payload: Dict[str, Any]) -> None:
+        self.payload = payload
+        self.uuid = payload['uuid']
+        self.username = payload['username']
+        self.email = payload.get('email')
+
+    @cached_property
+    def instance(self) -> User:
+        user = user_cache.get_by_uuid(self.uuid)
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('Invalid signature.'))
+        return user
+
+    @property
+    def is_loaded(self) -> bool:
+        return 'instance' in self.__dict__
+
+    def __getattr__(self, name: str) -> Any:
+        # only reached for attributes the token does not carry
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.instance, name)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, (TokenUser, User)) and other.uuid == self.uuid
+
+    def __hash__(self) -> int:
+        return hash(self.uuid)
+
+    def __str__(self) -> str:
+        return self.username
+
+
+class StatelessJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """
+    Same token handling as `JSONWebTokenAuthentication`, without fetching the user row on every request.
+    """
+
+    def authenticate(self, request):
+        # as the base class does, giving revoked tokens their own message
+        jwt_value = self.get_jwt_value(request)
+        if jwt_value is None:
+            return None
+
+        try:
+            payload = api_settings.JWT_DECODE_HANDLER(jwt_value)
+        except jwt.ExpiredSignature:
+            raise exceptions.AuthenticationFailed(_('Signature has expired.'))
+        except jwt.DecodeError:
+            raise exceptions.AuthenticationFailed(_('Error decoding signature.'))
+        except RevokedTokenError:
+            raise exceptions.AuthenticationFailed(_(RevokedTokenError.message))
+        except jwt.InvalidTokenError:
+            raise exceptions.AuthenticationFailed()
+
+        return self.authenticate_credentials(payload), jwt_value
+
+    def authenticate_credentials(self, payload: Dict[str, Any]) -> TokenUser:
+        if not payload.get('uuid') or not payload.get('username'):
+            raise exceptions.AuthenticationFailed(_('Invalid payload.'))
+
+        return TokenUser(payload)
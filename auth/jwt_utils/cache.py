@@ -0,0 +1,112 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Union
+
+from django.conf import settings
+
+
+Token = Union[str, bytes]
+Payload = Dict[str, Any]
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of already verified tokens and their decoded claims.
+
+    Entries are keyed by the token's sha256 digest and live until the earliest of the token's `exp` claim and
+    `max_ttl` seconds. The cache never holds more than `max_entries` tokens nor (approximately) `max_bytes`
+    of claims; the least recently used entries are evicted first.
+    """
+    # rough per entry cost of the digest key, the tuple and the dict holding the claims
+    ENTRY_OVERHEAD = 512
+
+    def __init__(self, max_entries: int, max_bytes: int, max_ttl: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+
+        self._entries: 'OrderedDict[bytes, Tuple[float, int, Payload]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token: Token) -> bytes:
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).digest()
+
+    def _pop(self, key: bytes) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def get(self, token: Token) -> Optional[Payload]:
+        key = self._key(token)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, _, payload = entry
+            if expires_at <= time.time():
+                self._pop(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        return dict(payload)
+
+    def set(self, token: Token, payload: Payload) -> None:
+        now = time.time()
+        expires_at = now + self.max_ttl
+        if isinstance(payload.get('exp'), (int, float)):
+            expires_at = min(expires_at, payload['exp'])
+
+        size = self.ENTRY_OVERHEAD + len(json.dumps(payload, default=str))
+        if expires_at <= now or size > self.max_bytes or self.max_entries <= 0:
+            return
+
+        key = self._key(token)
+
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+            self._entries[key] = (expires_at, size, dict(payload))
+            self.bytes += size
+
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+verified_tokens = VerifiedTokenCache(
+    max_entries=settings.JWT_TOKEN_CACHE['MAX_ENTRIES'],
+    max_bytes=settings.JWT_TOKEN_CACHE['MAX_BYTES'],
+    max_ttl=settings.JWT_TOKEN_CACHE['MAX_TTL'],
+)
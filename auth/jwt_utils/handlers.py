@@ -1,21 +1,67 @@
-from typing import Dict
+import uuid
+from typing import Any, Dict, Tuple, Union
 from datetime import datetime
+from functools import lru_cache
 
+import jwt
 from rest_framework_jwt.settings import api_settings
 
 from users.models import User
 from users.serializers import UserJwtPayloadSerializer
 
+from .cache import verified_tokens
+from .keys import keyring
+from .revocation import revocations
 
-def jwt_payload_handler(user: User) -> Dict[str, str]:
+
+class RevokedTokenError(jwt.InvalidTokenError):
+    # not an expired token: refreshing it is refused too, the client has to log in again
+    message = 'Token has been revoked.'
+
+
+@lru_cache(maxsize=None)
+def jwt_payload_fields() -> Tuple[str, ...]:
+    """
+    Readable fields of `UserJwtPayloadSerializer`, resolved once instead of on every token issued.
+    """
+    return tuple(name for name, field in UserJwtPayloadSerializer().fields.items() if not field.write_only)
+
+
+def jwt_user_claims(user: User) -> Dict[str, Any]:
+    # same output as UserJwtPayloadSerializer(user).data, reading the attributes directly
+    return {name: getattr(user, name) for name in jwt_payload_fields()}
+
+
+def jwt_payload_handler(user: User) -> Dict[str, Any]:
+    now = datetime.utcnow()
     return {
-        **UserJwtPayloadSerializer(user).data,
-        'exp': datetime.utcnow() + api_settings.JWT_EXPIRATION_DELTA
+        **jwt_user_claims(user),
+        'jti': uuid.uuid4().hex,
+        'iat': now,
+        'exp': now + api_settings.JWT_EXPIRATION_DELTA
     }
 
 
 def jwt_response_payload_handler(token, user=None, request=None):
     return {
         'token': token,
-        'user': UserJwtPayloadSerializer(user).data
+        'user': jwt_user_claims(user)
     }
+
+
+def jwt_encode_handler(payload: Dict[str, Any]) -> str:
+    return keyring.sign(payload)
+
+
+def jwt_decode_handler(token: Union[str, bytes]) -> Dict[str, Any]:
+    payload = verified_tokens.get(token)
+
+    if payload is None:
+        payload = keyring.verify(token)
+        verified_tokens.set(token, payload)
+
+    # checked on cache hits too, a token can be revoked after it was first verified
+    if revocations.is_revoked(payload):
+        raise RevokedTokenError(RevokedTokenError.message)
+
+    return payload
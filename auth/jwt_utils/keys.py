@@ -0,0 +1,107 @@
+import base64
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from django.conf import settings
+from rest_framework_jwt.settings import api_settings
+
+
+Token = Union[str, bytes]
+
+# names of the curves a JWK can describe, see RFC 7518 section 6.2.1.1
+JWK_CURVES = {'secp256r1': 'P-256', 'secp384r1': 'P-384', 'secp521r1': 'P-521'}
+
+
+def _b64_uint(value: int, length: int = 0) -> str:
+    data = value.to_bytes(max(length, (value.bit_length() + 7) // 8), 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def public_jwk(kid: str, algorithm: str, public_key: Any) -> Dict[str, str]:
+    """
+    JSON Web Key (RFC 7517) of an RSA or elliptic curve public key.
+    """
+    jwk = {'kid': kid, 'alg': algorithm, 'use': 'sig'}
+    numbers = public_key.public_numbers()
+
+    if isinstance(public_key, rsa.RSAPublicKey):
+        jwk.update(kty='RSA', n=_b64_uint(numbers.n), e=_b64_uint(numbers.e))
+    elif isinstance(public_key, ec.EllipticCurvePublicKey):
+        length = (public_key.curve.key_size + 7) // 8
+        jwk.update(kty='EC', crv=JWK_CURVES[public_key.curve.name],
+                   x=_b64_uint(numbers.x, length), y=_b64_uint(numbers.y, length))
+    else:
+        raise TypeError(f'Unsupported key type {type(public_key).__name__}')
+
+    return jwk
+
+
+class KeyRing:
+    """
+    Signing key plus every public key accepted for verification, indexed by key id (`kid`).
+
+    Tokens are signed with the signing key and carry its `kid` in their header; verification looks the key (and
+    the algorithm it is used with) up by that `kid`, so several keys can be live during a rotation. Tokens without
+    a `kid`, issued before key ids existed, are verified with the signing key.
+    """
+
+    def __init__(self, kid: str, algorithm: str, private_key: Any, public_key: Any,
+                 verification_keys: Iterable[Dict[str, Any]] = ()) -> None:
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = private_key
+
+        self.public_keys: Dict[str, Tuple[str, Any]] = {
+            key['kid']: (key['algorithm'], key['public_key']) for key in verification_keys
+        }
+        self.public_keys[kid] = (algorithm, public_key)
+
+    @classmethod
+    def from_settings(cls) -> 'KeyRing':
+        return cls(
+            kid=settings.JWT_KEY_ID,
+            algorithm=settings.JWT_ALGORITHM,
+            private_key=settings.PRIVATE_KEY,
+            public_key=settings.PUBLIC_KEY,
+            verification_keys=settings.JWT_VERIFICATION_KEYS,
+        )
+
+    def jwks(self) -> Dict[str, List[Dict[str, str]]]:
+        return {'keys': [
+            public_jwk(kid, algorithm, public_key) for kid, (algorithm, public_key) in self.public_keys.items()
+        ]}
+
+    def sign(self, payload: Dict[str, Any]) -> str:
+        return jwt.encode(payload, self.private_key, self.algorithm, headers={'kid': self.kid}).decode('utf-8')
+
+    def verification_key(self, token: Token) -> Tuple[str, Any]:
+        header = jwt.get_unverified_header(token)
+
+        try:
+            algorithm, public_key = self.public_keys[header.get('kid', self.kid)]
+        except (KeyError, TypeError):
+            raise jwt.DecodeError('Unknown key id.')
+
+        # each key is only ever used with its own algorithm
+        if header.get('alg') != algorithm:
+            raise jwt.DecodeError('Algorithm does not match the key.')
+
+        return algorithm, public_key
+
+    def verify(self, token: Token) -> Dict[str, Any]:
+        algorithm, public_key = self.verification_key(token)
+
+        return dict(jwt.decode(
+            token,
+            public_key,
+            api_settings.JWT_VERIFY,
+            options={'verify_exp': api_settings.JWT_VERIFY_EXPIRATION},
+            leeway=api_settings.JWT_LEEWAY,
+            audience=api_settings.JWT_AUDIENCE,
+            issuer=api_settings.JWT_ISSUER,
+            algorithms=[algorithm],
+        ))
+
+
+keyring = KeyRing.from_settings()
@@ -0,0 +1,71 @@
+import hashlib
+import secrets
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import User, RefreshToken
+
+
+# user columns read to sign the access token of a rotation
+USER_FIELDS = tuple(f'user__{name}' for name in ('id', 'uuid', 'username', 'email'))
+
+
+class InvalidRefreshToken(Exception):
+    pass
+
+
+def token_hash(token: str) -> str:
+    # refresh tokens are 256 random bits, a fast digest is enough to keep them unusable if the table leaks
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def issue(user: User, family: Optional[str] = None) -> str:
+    token = secrets.token_urlsafe(32)
+
+    RefreshToken.objects.create(
+        user=user,
+        token_hash=token_hash(token),
+        expires_at=timezone.now() + settings.REFRESH_TOKEN['LIFETIME'],
+        **({'family': family} if family is not None else {})
+    )
+    return token
+
+
+def rotate(token: str) -> Tuple[User, str]:
+    """
+    Revokes `token` and returns its user along with a new refresh token of the same family.
+
+    Costs one lookup by the unique `token_hash` index, no password hash. Reusing a revoked token revokes its
+    whole family, so both the thief and the legitimate client have to authenticate again.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        current = (
+            RefreshToken.objects
+            .select_related('user')
+            .only('id', 'family', 'expires_at', 'revoked', *USER_FIELDS)
+            .select_for_update(of=('self',))
+            .filter(token_hash=token_hash(token))
+            .first()
+        )
+
+        if current is None or current.expires_at <= now:
+            raise InvalidRefreshToken()
+
+        if current.revoked:
+            RefreshToken.objects.filter(family=current.family, revoked=False).update(revoked=True)
+            reused = True
+        else:
+            RefreshToken.objects.filter(id=current.id).update(revoked=True)
+            reused = False
+            successor = issue(current.user, family=current.family)
+
+    # raised once the family revocation is committed
+    if reused:
+        raise InvalidRefreshToken()
+
+    return current.user, successor
@@ -0,0 +1,206 @@
+import math
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import redis
+from django.conf import settings
+
+from auth.redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+# sorted sets, of token ids scored by their `exp` and of user uuids scored by the time of their revocation
+REVOKED_TOKENS_KEY = 'jwt:revoked:tokens'
+REVOKED_USERS_KEY = 'jwt:revoked:users'
+# carries `token:<jti>` and `user:<uuid>` entries as they are revoked
+REVOKED_CHANNEL = 'jwt:revoked'
+
+KEYS = {'token': REVOKED_TOKENS_KEY, 'user': REVOKED_USERS_KEY}
+
+
+class BloomFilter:
+    """
+    Set membership in `bits` bits: no false negatives, false positives at about `error_rate` up to `capacity` keys.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # double hashing, k positions out of a single digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def memory(self) -> int:
+        return len(self.array)
+
+    def false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+
+class RevocationList:
+    """
+    Revoked tokens (by `jti`) and users (every token issued to them until then), stored in redis.
+
+    Each process keeps a Bloom filter of the revoked entries, loaded every `resync_interval` seconds and kept up to
+    date in between through the `REVOKED_CHANNEL` pub/sub channel. A token the filter does not match is not
+    revoked, with no network call; only matches are confirmed against redis. When redis cannot be reached the
+    filter is kept as last loaded and matches are taken as revoked.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, resync_interval: int, user_retention: int,
+                 client: Callable[[], redis.StrictRedis] = get_redis) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.resync_interval = resync_interval
+        self.user_retention = user_retention
+        self._client = client
+
+        self._lock = threading.Lock()
+        self._filter = BloomFilter(capacity, error_rate)
+        self._pubsub: Optional[redis.client.PubSub] = None
+        self._synced_at: Optional[float] = None
+
+        self.checks = self.filter_hits = self.false_positives = 0
+
+    def revoke(self, jti: str, exp: int) -> None:
+        self._publish('token', jti, exp)
+
+    def revoke_user(self, uuid: str) -> None:
+        self._publish('user', uuid, time.time())
+
+    def _publish(self, kind: str, value: str, score: float) -> None:
+        pipeline = self._client().pipeline(transaction=False)
+        pipeline.zadd(KEYS[kind], score, value)
+        pipeline.publish(REVOKED_CHANNEL, f'{kind}:{value}')
+        pipeline.execute()
+
+        with self._lock:
+            self._filter.add(f'{kind}:{value}')
+
+    def is_revoked(self, payload: Dict[str, Any]) -> bool:
+        candidates = [
+            (kind, payload[claim]) for kind, claim in (('token', 'jti'), ('user', 'uuid')) if claim in payload
+        ]
+
+        with self._lock:
+            self._sync()
+            self.checks += 1
+            candidates = [(kind, value) for kind, value in candidates if f'{kind}:{value}' in self._filter]
+            if not candidates:
+                return False
+            self.filter_hits += 1
+
+        try:
+            revoked = self._confirm(payload, candidates)
+        except redis.RedisError as exc:
+            logger.warning('Could not confirm a possibly revoked token, rejecting it: %s', exc)
+            return True
+
+        if not revoked:
+            with self._lock:
+                self.false_positives += 1
+        return revoked
+
+    def _confirm(self, payload: Dict[str, Any], candidates: List[Tuple[str, str]]) -> bool:
+        pipeline = self._client().pipeline(transaction=False)
+        for kind, value in candidates:
+            pipeline.zscore(KEYS[kind], value)
+
+        for (kind, _), score in zip(candidates, pipeline.execute()):
+            # a user revocation covers the tokens issued up to it, tokens with no `iat` predate the claim
+            if score is not None and (kind == 'token' or payload.get('iat', 0) <= score):
+                return True
+        return False
+
+    def _sync(self) -> None:
+        if self._synced_at is None or time.monotonic() - self._synced_at >= self.resync_interval:
+            self._reload()
+        else:
+            self._drain()
+
+    def _reload(self) -> None:
+        self._synced_at = time.monotonic()
+        now = time.time()
+
+        try:
+            client = self._client()
+            if self._pubsub is None:
+                # subscribed before loading, so that nothing revoked meanwhile is missed
+                self._pubsub = client.pubsub()
+                self._pubsub.subscribe(REVOKED_CHANNEL)
+
+            pipeline = client.pipeline(transaction=False)
+            pipeline.zremrangebyscore(REVOKED_TOKENS_KEY, '-inf', now)
+            pipeline.zremrangebyscore(REVOKED_USERS_KEY, '-inf', now - self.user_retention)
+            pipeline.zrange(REVOKED_TOKENS_KEY, 0, -1)
+            pipeline.zrange(REVOKED_USERS_KEY, 0, -1)
+            _, _, tokens, users = pipeline.execute()
+        except redis.RedisError as exc:
+            logger.warning('Could not load revoked tokens, keeping the previous filter: %s', exc)
+            self._pubsub = None
+            return
+
+        keys = [f'token:{jti.decode()}' for jti in tokens] + [f'user:{uuid.decode()}' for uuid in users]
+
+        # rebuilt rather than updated, dropping expired entries and growing with the number of entries
+        self._filter = BloomFilter(max(self.capacity, 2 * len(keys)), self.error_rate)
+        for key in keys:
+            self._filter.add(key)
+
+        self._drain()
+
+    def _drain(self) -> None:
+        if self._pubsub is None:
+            return
+
+        try:
+            message = self._pubsub.get_message()
+            while message is not None:
+                if message['type'] == 'message':
+                    self._filter.add(message['data'].decode())
+                message = self._pubsub.get_message()
+        except redis.RedisError as exc:
+            logger.warning('Lost the revocation channel, resubscribing on the next load: %s', exc)
+            self._pubsub = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': self._filter.count,
+                'memory_bytes': self._filter.memory,
+                'hashes': self._filter.hashes,
+                'expected_false_positive_rate': self._filter.false_positive_rate(),
+                'checks': self.checks,
+                'filter_hits': self.filter_hits,
+                'false_positives': self.false_positives,
+                'observed_false_positive_rate': self.false_positives / self.checks if self.checks else 0.0,
+            }
+
+
+revocations = RevocationList(
+    capacity=settings.TOKEN_REVOCATION['FILTER_CAPACITY'],
+    error_rate=settings.TOKEN_REVOCATION['FILTER_ERROR_RATE'],
+    resync_interval=settings.TOKEN_REVOCATION['RESYNC_INTERVAL'],
+    user_retention=settings.TOKEN_REVOCATION['USER_RETENTION'],
+)
@@ -0,0 +1,56 @@
+from rest_framework import serializers
+from rest_framework_jwt.compat import Serializer
+from rest_framework_jwt.serializers import (
+    JSONWebTokenSerializer, RefreshJSONWebTokenSerializer, VerifyJSONWebTokenSerializer
+)
+from rest_framework_jwt.settings import api_settings
+
+from . import refresh
+from .handlers import RevokedTokenError
+
+
+class RevokedTokenMixin:
+    """
+    Reports revoked tokens with their own message, where rest_framework_jwt's serializers only expect expired
+    and undecodable ones.
+    """
+
+    def _check_payload(self, token):
+        try:
+            return super()._check_payload(token)  # type: ignore
+        except RevokedTokenError:
+            raise serializers.ValidationError(RevokedTokenError.message)
+
+
+class RefreshTokenSerializer(RevokedTokenMixin, RefreshJSONWebTokenSerializer):
+    pass
+
+
+class VerifyTokenSerializer(RevokedTokenMixin, VerifyJSONWebTokenSerializer):
+    pass
+
+
+class TokenPairSerializer(JSONWebTokenSerializer):
+    """
+    `JSONWebTokenSerializer` also issuing a refresh token, as `refresh_token`; see `jwt_utils.views`.
+    """
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        return {**attrs, 'refresh_token': refresh.issue(attrs['user'])}
+
+
+class RotateRefreshTokenSerializer(Serializer):
+    refresh_token = serializers.CharField()
+
+    def validate(self, attrs):
+        try:
+            user, refresh_token = refresh.rotate(attrs['refresh_token'])
+        except refresh.InvalidRefreshToken:
+            raise serializers.ValidationError('Invalid refresh token.')
+
+        return {
+            'token': api_settings.JWT_ENCODE_HANDLER(api_settings.JWT_PAYLOAD_HANDLER(user)),
+            'user': user,
+            'refresh_token': refresh_token,
+        }
@@ -1,9 +1,39 @@
+import json
+import time
+import uuid
+import base64
+from datetime import datetime
+from unittest.mock import patch
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.utils import timezone
 
+from rest_framework import exceptions
+from rest_framework.settings import api_settings as drf_api_settings
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
 from rest_framework_jwt.settings import api_settings
+import jwt
+import redis
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jwt import DecodeError
 
-from jwt_utils.handlers import jwt_payload_handler, jwt_response_payload_handler
+from auth.testing import APITestCase, TestCase, benchmark
+from jwt_utils.authentication import StatelessJSONWebTokenAuthentication, TokenUser
+from jwt_utils.cache import VerifiedTokenCache, verified_tokens
+from jwt_utils.handlers import (
+    jwt_payload_handler, jwt_response_payload_handler, jwt_encode_handler, jwt_decode_handler, jwt_payload_fields,
+    jwt_user_claims, RevokedTokenError
+)
+from jwt_utils.keys import KeyRing, keyring, public_jwk
+from jwt_utils import refresh
+from jwt_utils.revocation import BloomFilter, REVOKED_TOKENS_KEY
+from jwt_utils.serializers import RotateRefreshTokenSerializer, TokenPairSerializer
+from jwt_utils.views import jwks_document
+from users.models import RefreshToken
+from users.serializers import UserJwtPayloadSerializer
 
 User = get_user_model()
 
@@ -25,9 +55,11 @@ class TestPayLoadHandler(TestCase):
 
         payload = jwt_payload_handler(user_chi)
 
-        self.assertEqual(len(payload), 4)
+        self.assertEqual(len(payload), 6)
         self.assertIn('uuid', payload)
         self.assertIn('exp', payload)
+        self.assertEqual(payload['exp'] - payload['iat'], api_settings.JWT_EXPIRATION_DELTA)
+        self.assertNotEqual(payload['jti'], jwt_payload_handler(user_chi)['jti'])
         self.assertEqual(payload['username'], USER_CHI['username'])
         self.assertEqual(payload['email'], USER_CHI['email'])
 
@@ -53,3 +85,553 @@ class TestResponsePayLoadHandler(TestCase):
         self.assertIn('email', payload['user'])
         self.assertEqual(payload['user']['username'], USER_CHI['username'])
         self.assertEqual(payload['user']['email'], USER_CHI['email'])
+
+    def test_claims_of_the_current_user(self):
+        user_chi = User.objects.create_user(**USER_CHI)
+        jwt_payload_handler(user_chi)
+
+        # nothing is kept on the instance from a previous token
+        user_chi.username = 'chi2'
+        response_payload = jwt_response_payload_handler('dummy_token', user_chi)
+
+        self.assertEqual(response_payload['user']['username'], 'chi2')
+        self.assertFalse(hasattr(user_chi, '_jwt_claims'))
+
+
+class TestPayloadBuilder(TestCase):
+    ROUNDS = 2000
+
+    def setUp(self):
+        super().setUp()
+        self.user_chi = User.objects.create_user(**USER_CHI)
+
+    def test_fields(self):
+        self.assertEqual(jwt_payload_fields(), ('uuid', 'username', 'email'))
+
+    def test_matches_serializer(self):
+        self.assertEqual(jwt_user_claims(self.user_chi), UserJwtPayloadSerializer(self.user_chi).data)
+
+    @staticmethod
+    def _serializer_payload_handler(user):
+        # jwt_payload_handler as it was, building the claims through UserJwtPayloadSerializer
+        return {
+            **UserJwtPayloadSerializer(user).data,
+            'exp': datetime.utcnow() + api_settings.JWT_EXPIRATION_DELTA
+        }
+
+    def _rate(self, fn, rounds):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            fn(self.user_chi)
+        return rounds / (time.perf_counter() - started)
+
+    @benchmark
+    def test_benchmark(self):
+        serializer_rate = self._rate(self._serializer_payload_handler, self.ROUNDS)
+        builder_rate = self._rate(jwt_payload_handler, self.ROUNDS)
+
+        def issue(handler):
+            return lambda user: api_settings.JWT_ENCODE_HANDLER(handler(user))
+
+        serializer_tokens = self._rate(issue(self._serializer_payload_handler), self.ROUNDS // 20)
+        builder_tokens = self._rate(issue(jwt_payload_handler), self.ROUNDS // 20)
+
+        print(f'\npayloads/s: {serializer_rate:.0f} serializer, {builder_rate:.0f} builder; '
+              f'tokens/s: {serializer_tokens:.0f} serializer, {builder_tokens:.0f} builder')
+
+
+class TestStatelessAuthentication(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user_chi = User.objects.create_user(**USER_CHI)
+        self.request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'JWT {self.user_chi.create_jwt()}')
+
+    def test_settings(self):
+        self.assertEqual(drf_api_settings.DEFAULT_AUTHENTICATION_CLASSES, [StatelessJSONWebTokenAuthentication])
+
+    def test_authenticate_without_queries(self):
+        with self.assertNumQueries(0):
+            user, _ = StatelessJSONWebTokenAuthentication().authenticate(self.request)
+
+        self.assertIsInstance(user, TokenUser)
+        self.assertTrue(user.is_authenticated)
+        self.assertFalse(user.is_loaded)
+        self.assertEqual(user.uuid, self.user_chi.uuid)
+        self.assertEqual(user.username, USER_CHI['username'])
+        self.assertEqual(user.email, USER_CHI['email'])
+        self.assertEqual(user, self.user_chi)
+
+    def test_lazy_model_fields(self):
+        user, _ = StatelessJSONWebTokenAuthentication().authenticate(self.request)
+
+        with self.assertNumQueries(1):
+            self.assertFalse(user.email_confirmed)
+            self.assertEqual(user.id, self.user_chi.id)
+
+        self.assertTrue(user.is_loaded)
+
+    def test_lazy_model_fields_deleted_user(self):
+        user, _ = StatelessJSONWebTokenAuthentication().authenticate(self.request)
+        self.user_chi.delete()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            user.email_confirmed
+
+    def test_invalid_payload(self):
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            StatelessJSONWebTokenAuthentication().authenticate_credentials({'email': USER_CHI['email']})
+
+
+class TestVerifiedTokenCache(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = VerifiedTokenCache(max_entries=2, max_bytes=4096, max_ttl=60)
+        self.payload = {'uuid': 'abc', 'exp': int(time.time()) + 60}
+
+    def test_hit_miss(self):
+        self.assertIsNone(self.cache.get('token'))
+        self.cache.set('token', self.payload)
+        self.assertEqual(self.cache.get(b'token'), self.payload)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_returns_copies(self):
+        self.cache.set('token', self.payload)
+        self.cache.get('token')['uuid'] = 'tampered'
+        self.assertEqual(self.cache.get('token')['uuid'], 'abc')
+
+    def test_lru_eviction(self):
+        self.cache.set('a', self.payload)
+        self.cache.set('b', self.payload)
+        self.cache.get('a')
+        self.cache.set('c', self.payload)
+
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('c'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_memory_cap(self):
+        cache = VerifiedTokenCache(max_entries=100, max_bytes=VerifiedTokenCache.ENTRY_OVERHEAD + 64, max_ttl=60)
+        cache.set('a', self.payload)
+        cache.set('b', self.payload)
+
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertLessEqual(cache.stats()['bytes'], cache.max_bytes)
+        self.assertIsNone(cache.get('a'))
+
+    def test_capped_at_exp(self):
+        self.cache.set('expired', {**self.payload, 'exp': int(time.time()) - 1})
+        self.assertIsNone(self.cache.get('expired'))
+
+        self.cache.set('expiring', {**self.payload, 'exp': time.time() + 0.05})
+        self.assertIsNotNone(self.cache.get('expiring'))
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('expiring'))
+
+
+class TestDecodeHandler(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user_chi = User.objects.create_user(**USER_CHI)
+        self.token = self.user_chi.create_jwt()
+
+    def test_settings(self):
+        self.assertEqual(api_settings.JWT_DECODE_HANDLER, jwt_decode_handler)
+
+    def test_verifies_once(self):
+        with patch.object(keyring, 'verify', wraps=keyring.verify) as mock:
+            payload = jwt_decode_handler(self.token)
+            self.assertEqual(jwt_decode_handler(self.token), payload)
+            self.assertEqual(jwt_decode_handler(self.token.encode('utf-8')), payload)
+            mock.assert_called_once_with(self.token)
+
+        self.assertEqual(payload['username'], USER_CHI['username'])
+        self.assertIsNotNone(verified_tokens.get(self.token))
+
+    def test_bad_token_not_cached(self):
+        bad_token = f'{self.token}_taint'
+        for _ in range(2):
+            with self.assertRaises(DecodeError):
+                jwt_decode_handler(bad_token)
+        self.assertIsNone(verified_tokens.get(bad_token))
+
+    def test_revoked(self):
+        payload = jwt_decode_handler(self.token)
+        self.revocations.revoke(payload['jti'], payload['exp'])
+
+        # verified tokens are cached, revocation is checked regardless
+        with self.assertRaises(RevokedTokenError):
+            jwt_decode_handler(self.token)
+        self.assertIsNotNone(jwt_decode_handler(self.user_chi.create_jwt()))
+
+    def test_revoked_api(self):
+        http_auth = {'HTTP_AUTHORIZATION': f'JWT {self.token}'}
+        self.assertEqual(self.client.get('/users/me', **http_auth).status_code, status.HTTP_200_OK)
+
+        self.revocations.revoke_user(self.user_chi.uuid)
+        response = self.client.get('/users/me', **http_auth)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json()['detail'], 'Token has been revoked.')
+
+        for url in ('/jwt/token-refresh', '/jwt/token-verify'):
+            response = self.client.post(url, data=json.dumps({'token': self.token}), content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.json()['non_field_errors'], ['Token has been revoked.'])
+
+
+def _rsa_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+
+
+def _ec_key():
+    return ec.generate_private_key(ec.SECP256R1(), default_backend())
+
+
+class TestKeyRing(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rsa_key, self.ec_key = _rsa_key(), _ec_key()
+        self.old = KeyRing('2018-11', 'RS256', self.rsa_key, self.rsa_key.public_key())
+        self.new = KeyRing('2018-12', 'ES256', self.ec_key, self.ec_key.public_key(), verification_keys=[
+            {'kid': '2018-11', 'algorithm': 'RS256', 'public_key': self.rsa_key.public_key()},
+        ])
+        self.payload = {'uuid': 'a' * 32, 'username': USER_CHI['username']}
+
+    def test_settings(self):
+        self.assertEqual(api_settings.JWT_ENCODE_HANDLER, jwt_encode_handler)
+        self.assertEqual(jwt.get_unverified_header(jwt_encode_handler(self.payload))['kid'], keyring.kid)
+
+    def test_sign(self):
+        token = self.new.sign(self.payload)
+        self.assertEqual(jwt.get_unverified_header(token), {'typ': 'JWT', 'alg': 'ES256', 'kid': '2018-12'})
+        self.assertEqual(self.new.verify(token), self.payload)
+
+    def test_rotation(self):
+        # tokens signed with the retiring key are still accepted, tokens signed with the new one are not by the old
+        self.assertEqual(self.new.verify(self.old.sign(self.payload)), self.payload)
+        with self.assertRaises(DecodeError):
+            self.old.verify(self.new.sign(self.payload))
+
+    def test_picks_key_by_kid(self):
+        with patch('jwt.decode', wraps=jwt.decode) as mock:
+            self.new.verify(self.old.sign(self.payload))
+        mock.assert_called_once()
+        self.assertEqual(mock.call_args[0][1], self.new.public_keys['2018-11'][1])
+        self.assertEqual(mock.call_args[1]['algorithms'], ['RS256'])
+
+    def test_no_kid(self):
+        token = jwt.encode(self.payload, self.ec_key, 'ES256').decode('utf-8')
+        self.assertEqual(self.new.verify(token), self.payload)
+        with self.assertRaises(DecodeError):
+            self.old.verify(token)
+
+    def test_algorithm_pinned_to_key(self):
+        # a token claiming another algorithm than the one its key is used with is rejected
+        token = jwt.encode(self.payload, self.ec_key, 'ES256', headers={'kid': '2018-11'}).decode('utf-8')
+        with self.assertRaises(DecodeError):
+            self.new.verify(token)
+
+    def test_unknown_kid(self):
+        token = jwt.encode(self.payload, _ec_key(), 'ES256', headers={'kid': 'unknown'}).decode('utf-8')
+        with self.assertRaises(DecodeError):
+            self.new.verify(token)
+
+
+class TestSigningBenchmark(TestCase):
+    ROUNDS = 300
+
+    def setUp(self):
+        super().setUp()
+        rsa_key, ec_key = _rsa_key(), _ec_key()
+        self.keyrings = {
+            'RS256': KeyRing('rsa', 'RS256', rsa_key, rsa_key.public_key()),
+            'ES256': KeyRing('ec', 'ES256', ec_key, ec_key.public_key()),
+        }
+        if 'EdDSA' in jwt.algorithms.get_default_algorithms():  # pragma: no cover
+            from cryptography.hazmat.primitives.asymmetric import ed25519
+            ed_key = ed25519.Ed25519PrivateKey.generate()
+            self.keyrings['EdDSA'] = KeyRing('ed', 'EdDSA', ed_key, ed_key.public_key())
+
+        self.payload = {'uuid': 'a' * 32, 'username': USER_CHI['username'], 'email': USER_CHI['email']}
+
+    def _rate(self, fn, arg):
+        started = time.perf_counter()
+        for _ in range(self.ROUNDS):
+            fn(arg)
+        return self.ROUNDS / (time.perf_counter() - started)
+
+    @benchmark
+    def test_benchmark(self):
+        rates = {}
+        for algorithm, ring in self.keyrings.items():
+            token = ring.sign(self.payload)
+            rates[algorithm] = self._rate(ring.sign, self.payload), self._rate(ring.verify, token)
+
+        print('\n' + '; '.join(
+            f'{algorithm}: {sign:.0f} sign/s, {verify:.0f} verify/s' for algorithm, (sign, verify) in rates.items()))
+
+
+class TestJwks(APITestCase):
+    URL = '/.well-known/jwks.json'
+
+    def test_jwk_rsa(self):
+        key = _rsa_key().public_key()
+        jwk = public_jwk('rsa', 'RS256', key)
+
+        self.assertEqual(jwk['kty'], 'RSA')
+        self.assertEqual(jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk)).public_numbers(), key.public_numbers())
+
+    def test_jwk_ec(self):
+        key = _ec_key().public_key()
+        jwk = public_jwk('ec', 'ES256', key)
+
+        self.assertEqual((jwk['kty'], jwk['crv'], len(jwk['x']), len(jwk['y'])), ('EC', 'P-256', 43, 43))
+        numbers = ec.EllipticCurvePublicNumbers(
+            int.from_bytes(base64.urlsafe_b64decode(jwk['x'] + '='), 'big'),
+            int.from_bytes(base64.urlsafe_b64decode(jwk['y'] + '='), 'big'),
+            ec.SECP256R1(),
+        )
+        self.assertEqual(numbers, key.public_numbers())
+
+    def test_jwks(self):
+        response = self.client.get(self.URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response['ETag'], f'"{jwks_document()[1]}"')
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.JWKS_MAX_AGE}')
+
+        keys = {jwk['kid']: jwk for jwk in json.loads(response.content)['keys']}
+        self.assertEqual(set(keys), set(keyring.public_keys))
+        self.assertEqual(keys[keyring.kid]['alg'], keyring.algorithm)
+
+        # an issued token verifies with the published key alone
+        token = User.objects.create_user(**USER_CHI).create_jwt()
+        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(keys[jwt.get_unverified_header(token)['kid']]))
+        self.assertEqual(jwt.decode(token, public_key, algorithms=['RS256'])['username'], USER_CHI['username'])
+
+    def test_not_modified(self):
+        etag = self.client.get(self.URL)['ETag']
+
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('max-age', response['Cache-Control'])
+
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH='"stale"').status_code, status.HTTP_200_OK)
+
+    def test_serialized_once(self):
+        jwks_document()
+        with patch.object(keyring, 'jwks', wraps=keyring.jwks) as mock:
+            for _ in range(3):
+                self.client.get(self.URL)
+        mock.assert_not_called()
+
+    def test_post_405(self):
+        self.assertEqual(self.client.post(self.URL).status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class TestRefreshTokens(APITestCase):
+    OBTAIN_URL = '/jwt/token-obtain'
+    ROTATE_URL = '/jwt/token-rotate'
+
+    def setUp(self):
+        super().setUp()
+        self.user_chi = User.objects.create_user(**USER_CHI)
+
+    def _obtain(self):
+        response = self.client.post(
+            self.OBTAIN_URL, {'username': USER_CHI['username'], 'password': USER_CHI['password']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def _rotate(self, refresh_token):
+        return self.client.post(self.ROTATE_URL, {'refresh_token': refresh_token}, format='json')
+
+    def test_obtain(self):
+        data = self._obtain()
+
+        self.assertEqual(set(data), {'token', 'user', 'refresh_token'})
+        stored = RefreshToken.objects.get()
+        self.assertEqual(stored.user, self.user_chi)
+        self.assertEqual(stored.token_hash, refresh.token_hash(data['refresh_token']))
+        self.assertNotEqual(stored.token_hash, data['refresh_token'])
+        self.assertFalse(stored.revoked)
+
+    def test_refresh_token_in_validated_data(self):
+        serializer = TokenPairSerializer(data={'username': USER_CHI['username'], 'password': USER_CHI['password']})
+        self.assertTrue(serializer.is_valid())
+        first = serializer.validated_data['refresh_token']
+
+        serializer = RotateRefreshTokenSerializer(data={'refresh_token': first})
+        self.assertTrue(serializer.is_valid())
+        self.assertNotEqual(serializer.validated_data['refresh_token'], first)
+        # not left on the user, which may be a shared instance
+        self.assertFalse(hasattr(serializer.validated_data['user'], '_refresh_token'))
+
+    def test_token_verify_unchanged(self):
+        token = self._obtain()['token']
+        response = self.client.post('/jwt/token-verify', {'token': token}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('refresh_token', response.data)
+
+    def test_rotate(self):
+        first = self._obtain()['refresh_token']
+
+        with patch('users.hashing.check_password') as mock_hash:
+            response = self._rotate(first)
+        mock_hash.assert_not_called()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], USER_CHI['username'])
+        self.assertEqual(api_settings.JWT_DECODE_HANDLER(response.data['token'])['uuid'], self.user_chi.uuid)
+
+        second = response.data['refresh_token']
+        self.assertNotEqual(second, first)
+
+        old, new = RefreshToken.objects.order_by('id')
+        self.assertEqual((old.revoked, new.revoked), (True, False))
+        self.assertEqual(old.family, new.family)
+
+        self.assertEqual(self._rotate(second).status_code, status.HTTP_200_OK)
+
+    def test_rotate_queries(self):
+        token = refresh.issue(self.user_chi)
+
+        # select for update, revoke, insert the successor; within a savepoint
+        with self.assertNumQueries(5):
+            refresh.rotate(token)
+
+    def test_reuse_revokes_family(self):
+        first = self._obtain()['refresh_token']
+        other_session = self._obtain()['refresh_token']
+        second = self._rotate(first).data['refresh_token']
+
+        response = self._rotate(first)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # the legitimate successor is gone too, other sessions are not affected
+        self.assertEqual(self._rotate(second).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._rotate(other_session).status_code, status.HTTP_200_OK)
+
+    def test_expired(self):
+        token = refresh.issue(self.user_chi)
+        RefreshToken.objects.update(expires_at=timezone.now())
+
+        self.assertEqual(self._rotate(token).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(RefreshToken.objects.get().revoked)
+
+    def test_unknown(self):
+        response = self._rotate('unknown')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['non_field_errors'], ['Invalid refresh token.'])
+
+        self.assertEqual(self.client.post(self.ROTATE_URL, {}, format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_deleted_user(self):
+        token = refresh.issue(self.user_chi)
+        self.user_chi.delete()
+        self.assertEqual(self._rotate(token).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestBloomFilter(TestCase):
+
+    def test_sizing(self):
+        bloom = BloomFilter(100000, 0.001)
+        self.assertEqual(bloom.hashes, 10)
+        self.assertLess(bloom.memory, 200 * 1024)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(10000, 0.01)
+        for i in range(10000):
+            bloom.add(f'in:{i}')
+
+        self.assertTrue(all(f'in:{i}' in bloom for i in range(10000)))
+        false_positives = sum(f'out:{i}' in bloom for i in range(20000))
+        self.assertLess(false_positives / 20000, 0.02)
+        self.assertAlmostEqual(bloom.false_positive_rate(), 0.01, delta=0.002)
+
+
+class TestRevocationList(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = int(time.time())
+        self.payload = {'uuid': 'a' * 32, 'jti': 'b' * 32, 'iat': self.now, 'exp': self.now + 300}
+
+    def test_not_revoked_without_redis(self):
+        self.assertFalse(self.revocations.is_revoked(self.payload))
+
+        with patch.object(self.redis, 'pipeline', side_effect=redis.ConnectionError) as mock:
+            for _ in range(10):
+                self.assertFalse(self.revocations.is_revoked({**self.payload, 'jti': uuid.uuid4().hex}))
+        mock.assert_not_called()
+
+    def test_revoke(self):
+        self.revocations.revoke(self.payload['jti'], self.payload['exp'])
+        self.assertTrue(self.revocations.is_revoked(self.payload))
+        self.assertFalse(self.revocations.is_revoked({**self.payload, 'jti': 'c' * 32}))
+
+    def test_revoke_user(self):
+        self.revocations.revoke_user(self.payload['uuid'])
+
+        self.assertTrue(self.revocations.is_revoked(self.payload))
+        self.assertTrue(self.revocations.is_revoked({'uuid': self.payload['uuid']}))
+        # issued after the revocation
+        self.assertFalse(self.revocations.is_revoked({**self.payload, 'iat': self.now + 10}))
+
+    def test_other_processes(self):
+        loaded, other = self.revocation_list(), self.revocation_list()
+        self.revocations.revoke(self.payload['jti'], self.payload['exp'])
+
+        # loads what was revoked so far, then follows the channel
+        self.assertTrue(loaded.is_revoked(self.payload))
+        self.assertFalse(other.is_revoked({**self.payload, 'jti': 'c' * 32}))
+        self.revocations.revoke('c' * 32, self.payload['exp'])
+
+        with patch.object(self.redis, 'zrange', side_effect=AssertionError('reloaded')):
+            self.assertTrue(other.is_revoked({**self.payload, 'jti': 'c' * 32}))
+
+    def test_resync_prunes(self):
+        revocations = self.revocation_list(resync_interval=0)
+        self.revocations.revoke('expired', self.now - 1)
+        self.revocations.revoke(self.payload['jti'], self.payload['exp'])
+
+        self.assertTrue(revocations.is_revoked(self.payload))
+        self.assertEqual(self.redis.zrange(REVOKED_TOKENS_KEY, 0, -1), [self.payload['jti'].encode()])
+        self.assertEqual(revocations.stats()['entries'], 1)
+
+    def test_fails_closed_on_matches(self):
+        self.revocations.revoke(self.payload['jti'], self.payload['exp'])
+
+        with patch.object(self.redis, 'pipeline', side_effect=redis.ConnectionError):
+            self.assertTrue(self.revocations.is_revoked(self.payload))
+            self.assertFalse(self.revocations.is_revoked({'jti': 'c' * 32}))
+
+    def test_redis_down_on_load(self):
+        revocations = self.revocation_list()
+        with patch.object(self.redis, 'pubsub', side_effect=redis.ConnectionError):
+            self.assertFalse(revocations.is_revoked(self.payload))
+
+    def test_stats(self):
+        for i in range(100):
+            self.revocations.revoke(f'revoked{i}', self.payload['exp'])
+        for i in range(2000):
+            self.revocations.is_revoked({'jti': f'valid{i}'})
+
+        stats = self.revocations.stats()
+        self.assertEqual((stats['entries'], stats['checks']), (100, 2000))
+        self.assertEqual(stats['false_positives'], stats['filter_hits'])
+        self.assertLess(stats['observed_false_positive_rate'], 0.01)
+        self.assertLess(stats['expected_false_positive_rate'], 0.001)
@@ -1,9 +1,11 @@
 from django.urls import path
-from rest_framework_jwt.views import obtain_jwt_token, refresh_jwt_token, verify_jwt_token
+
+from .views import obtain_token_pair, refresh_token, rotate_refresh_token, verify_token
 
 
 urlpatterns = [
-    path('token-obtain', obtain_jwt_token),
-    path('token-refresh', refresh_jwt_token),
-    path('token-verify', verify_jwt_token),
+    path('token-obtain', obtain_token_pair),
+    path('token-refresh', refresh_token),
+    path('token-verify', verify_token),
+    path('token-rotate', rotate_refresh_token),
 ]
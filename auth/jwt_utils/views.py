@@ -0,0 +1,74 @@
+import json
+import hashlib
+from functools import lru_cache
+from typing import Tuple
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework_jwt.settings import api_settings
+from rest_framework_jwt.views import JSONWebTokenAPIView, RefreshJSONWebToken, VerifyJSONWebToken
+
+from users.throttling import RateThrottle
+
+from .keys import keyring
+from .serializers import (
+    TokenPairSerializer, RotateRefreshTokenSerializer, RefreshTokenSerializer, VerifyTokenSerializer
+)
+
+
+@lru_cache(maxsize=None)
+def jwks_document() -> Tuple[bytes, str]:
+    """
+    Serialized JWK set of the keyring and its ETag, built once per process.
+    """
+    content = json.dumps(keyring.jwks(), sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return content, hashlib.sha256(content).hexdigest()
+
+
+@require_safe
+@cache_control(public=True, max_age=settings.JWKS_MAX_AGE)
+@condition(etag_func=lambda request: jwks_document()[1])
+def jwks_view(request):
+    # conditional requests are answered with 304 by `condition`, before getting here
+    return HttpResponse(jwks_document()[0], content_type='application/json')
+
+
+class TokenPairAPIView(JSONWebTokenAPIView):
+    """
+    `JSONWebTokenAPIView` answering with the refresh token issued by its serializer next to the access token.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.object
+        payload = api_settings.JWT_RESPONSE_PAYLOAD_HANDLER(data['token'], data['user'], request)
+        return Response({**payload, 'refresh_token': data['refresh_token']})
+
+
+class ObtainTokenPairView(TokenPairAPIView):
+    """
+    Exchanges username (or email) and password for an access token and a refresh token.
+    """
+    serializer_class = TokenPairSerializer
+    throttle_classes = (RateThrottle,)
+    throttle_scope = 'login'
+
+
+class RotateRefreshTokenView(TokenPairAPIView):
+    """
+    Exchanges a refresh token for an access token and the next refresh token, without the password.
+    """
+    serializer_class = RotateRefreshTokenSerializer
+
+
+obtain_token_pair = ObtainTokenPairView.as_view()
+rotate_refresh_token = RotateRefreshTokenView.as_view()
+refresh_token = RefreshJSONWebToken.as_view(serializer_class=RefreshTokenSerializer)
+verify_token = VerifyJSONWebToken.as_view(serializer_class=VerifyTokenSerializer)
@@ -1,23 +1,42 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Case, IntegerField, Value, When
+
+from . import hashing
 
 
 User = get_user_model()
 
 
 class UsernameEmailModelBackend:
+    # columns needed to check the password and to issue a token
+    LOGIN_FIELDS = ('id', 'password', 'uuid', 'username', 'email')
+
+    @classmethod
+    def login_queryset(cls, username):
+        field = 'email' if '@' in username else 'username'
+        # an exact match first, so that it is among the two candidates fetched however many case variants exist
+        exact_first = Case(When(**{field: username}, then=Value(0)), default=Value(1), output_field=IntegerField())
+        return User.objects.only(*cls.LOGIN_FIELDS).filter(**{f'{field}__lower': username.lower()}).order_by(
+            exact_first)
+
+    @staticmethod
+    def _pick_user(candidates, username):
+        # case-insensitive matching may find both 'Chi' and 'chi', an exact match settles it
+        if len(candidates) == 1:
+            return candidates[0]
+
+        exact = [user for user in candidates if username in (user.username, user.email)]
+        return exact[0] if exact else None
+
     def authenticate(self, request, username=None, password=None):
         authenticated_user = None
 
         if username is not None:
-            if '@' in username:
-                query_args = {'email': username}
-            else:
-                query_args = {'username': username}
-            try:
-                user = User.objects.get(**query_args)
-                if user.check_password(password):
+            user = self._pick_user(list(self.login_queryset(username)[:2]), username)
+            if user is not None:
+                if hashing.check_password(user, password):
                     authenticated_user = user
-            except User.DoesNotExist:
-                User().set_password(password)
+            else:
+                hashing.check_dummy_password(password)
 
         return authenticated_user
@@ -0,0 +1,236 @@
+import io
+import os
+import re
+import csv
+import json
+import itertools
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from django.contrib.auth import hashers
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .managers import UserManager
+from .models import User, UUID4HEX_LEN
+
+
+FORMATS = ('csv', 'ndjson')
+
+# columns of an import row, the first three are required; an export has them all plus `updated_at`
+IMPORT_FIELDS = ('username', 'email', 'password', 'uuid', 'email_confirmed', 'created_at')
+REQUIRED_FIELDS = IMPORT_FIELDS[:3]
+EXPORT_FIELDS = ('uuid', 'username', 'email', 'password', 'email_confirmed', 'created_at', 'updated_at')
+
+# columns written by COPY, every other one of users_user has a database default
+COPY_COLUMNS = ('password', 'uuid', 'email', 'username', 'email_confirmed', 'updated_at', 'created_at')
+
+TRUE_VALUES = ('1', 't', 'true', 'y', 'yes')
+UUID_RE = re.compile(f'[0-9a-f]{{{UUID4HEX_LEN}}}')
+
+# (line number, row), a row that failed to parse being None
+Line = Tuple[int, Optional[Dict[str, Any]]]
+
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[Line]:
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_num, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                parsed = json.loads(line)
+            except ValueError:
+                parsed = None
+            yield line_num, parsed if isinstance(parsed, dict) else None
+
+
+def is_password_hash(value: str) -> bool:
+    # unusable passwords ('!...') are kept as they are, never hashed as if they were a plaintext
+    if value.startswith(hashers.UNUSABLE_PASSWORD_PREFIX):
+        return True
+    try:
+        hashers.identify_hasher(value)
+    except ValueError:
+        return False
+    return True
+
+
+class UserImporter:
+    """
+    Inserts users read from CSV or NDJSON rows in batches of `batch_size`, each copied (COPY) into a temporary
+    table and moved to users_user skipping the rows that conflict with an existing user, so that memory use only
+    depends on the batch size.
+
+    Passwords already hashed (Django's `algorithm$...` format) are stored as they are, plaintext ones are hashed
+    by a pool of `workers` processes. Rows failing validation are skipped and passed to `reject`.
+
+    As with a queryset's `bulk_create`, no signals are sent: imported users get no registration events, and a
+    "no such user" entry of `users.cache` is only dropped when it expires.
+    """
+
+    def __init__(self, batch_size: int = 10000, workers: Optional[int] = None,
+                 reject: Callable[[int, str], None] = lambda line, message: None) -> None:
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.reject = reject
+
+        self.username_validator = User.username_validator
+        self.black_list = frozenset(User.blacklist_validator.black_list)
+        self.email_validator = EmailValidator()
+        self.username_max_length = User._meta.get_field('username').max_length
+        self.email_max_length = User._meta.get_field('email').max_length
+
+        self._pool: Optional[Executor] = None
+        self.counters = {'read': 0, 'rejected': 0, 'hashed': 0, 'inserted': 0, 'conflicts': 0}
+
+    @property
+    def pool(self) -> Executor:
+        # started on the first plaintext password, imports of hashed passwords fork no process
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def run(self, lines: Iterable[Line]) -> Dict[str, int]:
+        remaining = iter(lines)
+        try:
+            while True:
+                batch = list(itertools.islice(remaining, self.batch_size))
+                if not batch:
+                    break
+
+                self.counters['read'] += len(batch)
+                rows = self.validate(batch)
+                self.hash_passwords(rows)
+                self.copy(rows)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+        return dict(self.counters)
+
+    def _invalid(self, line: int, message: str) -> None:
+        self.counters['rejected'] += 1
+        self.reject(line, message)
+
+    def validate(self, batch: List[Line]) -> List[Dict[str, Any]]:
+        """
+        The rows of `batch` fit for insertion, cleaned with the checks of `User`'s fields, built once per import.
+        """
+        now = timezone.now()
+        rows = []
+
+        for line, row in batch:
+            if row is None:
+                self._invalid(line, 'Malformed row.')
+                continue
+
+            missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+            if missing:
+                self._invalid(line, f'Missing {", ".join(missing)}.')
+                continue
+
+            try:
+                rows.append(self.clean(row, now))
+            except ValidationError as exc:
+                self._invalid(line, ' '.join(exc.messages))
+            except (TypeError, ValueError):
+                self._invalid(line, 'Malformed row.')
+
+        return rows
+
+    def clean(self, row: Dict[str, Any], now) -> Dict[str, Any]:
+        username, email = str(row['username']), UserManager.normalize_email(str(row['email']))
+
+        if len(username) > self.username_max_length:
+            raise ValidationError(f'Username longer than {self.username_max_length} characters.')
+        self.username_validator(username)
+        if username in self.black_list:
+            raise ValidationError(User.blacklist_validator.MESSAGE)
+
+        if len(email) > self.email_max_length:
+            raise ValidationError(f'Email longer than {self.email_max_length} characters.')
+        self.email_validator(email)
+
+        uuid = row.get('uuid') or None
+        if uuid is not None:
+            uuid = str(uuid).lower()
+            if not UUID_RE.fullmatch(uuid):
+                raise ValidationError('Invalid uuid.')
+
+        email_confirmed = row.get('email_confirmed')
+        if not isinstance(email_confirmed, bool):
+            email_confirmed = str(email_confirmed or '').lower() in TRUE_VALUES
+
+        created_at = row.get('created_at')
+        created_at = parse_datetime(str(created_at)) if created_at else now
+        if created_at is None:
+            raise ValidationError('Invalid created_at.')
+
+        return {
+            'password': str(row['password']),
+            'uuid': uuid or User._meta.get_field('uuid').get_default(),
+            'email': email,
+            'username': username,
+            'email_confirmed': email_confirmed,
+            'updated_at': now,
+            'created_at': created_at,
+        }
+
+    def hash_passwords(self, rows: List[Dict[str, Any]]) -> None:
+        plaintext = [row for row in rows if not is_password_hash(row['password'])]
+        if not plaintext:
+            return
+
+        chunksize = max(1, len(plaintext) // (4 * self.workers))
+        hashed = self.pool.map(hashers.make_password, [row['password'] for row in plaintext], chunksize=chunksize)
+        for row, password in zip(plaintext, hashed):
+            row['password'] = password
+        self.counters['hashed'] += len(plaintext)
+
+    def copy(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[column] for column in COPY_COLUMNS])
+        buffer.seek(0)
+
+        columns = ', '.join(COPY_COLUMNS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'CREATE TEMPORARY TABLE users_user_import AS SELECT {columns} FROM users_user WITH NO DATA')
+            cursor.copy_expert(f'COPY users_user_import ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+            # duplicates of an existing user, or of an earlier row, are skipped rather than failing the batch
+            cursor.execute(
+                f'INSERT INTO users_user ({columns}) SELECT {columns} FROM users_user_import ON CONFLICT DO NOTHING')
+            inserted = cursor.rowcount
+            cursor.execute('DROP TABLE users_user_import')
+
+        self.counters['inserted'] += inserted
+        self.counters['conflicts'] += len(rows) - inserted
+
+
+def export_users(stream: TextIO, fmt: str) -> None:
+    """
+    Writes every user, as EXPORT_FIELDS, to `stream`: straight from a COPY, one row at a time.
+    """
+    query = f'SELECT {", ".join(EXPORT_FIELDS)} FROM users_user ORDER BY id'
+
+    if fmt == 'csv':
+        sql = f'COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)'
+    else:
+        # csv with quote and delimiter characters that JSON escapes, so that each object is written verbatim
+        sql = f"COPY (SELECT row_to_json(u) FROM ({query}) u) TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', " \
+              f"DELIMITER E'\\x02')"
+
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, stream)
@@ -0,0 +1,313 @@
+import json
+import time
+import datetime
+import logging
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+
+from auth.redis_client import get_redis
+from .models import User
+
+
+logger = logging.getLogger(__name__)
+
+# bumped whenever CACHED_FIELDS change, so that entries of the previous layout are never read
+VERSION = 1
+# never the password (nor last_login, unused), which are left deferred on cached instances
+CACHED_FIELDS = ('id', 'uuid', 'username', 'email', 'email_confirmed', 'updated_at', 'created_at')
+DATETIME_FIELDS = ('updated_at', 'created_at')
+# CACHED_FIELDS in the order of the model's fields, as Model.from_db expects them
+INSTANCE_FIELDS = tuple(field.attname for field in User._meta.concrete_fields if field.attname in CACHED_FIELDS)
+
+# compare and delete, so that a lock is only released by its holder
+RELEASE_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+# an invalidation leaves a tombstone per key holding the version (updated_at, in microseconds) the entry has to reach:
+# readers that loaded the row before the invalidation must not store it after, to be served for the whole TTL
+INVALIDATE_SCRIPT = """
+for i = 1, #KEYS / 2 do
+    redis.call('DEL', KEYS[i])
+    local tombstone = KEYS[#KEYS / 2 + i]
+    local version = tonumber(redis.call('GET', tombstone))
+    if version == nil or version < tonumber(ARGV[1]) then
+        redis.call('SET', tombstone, ARGV[1])
+        redis.call('EXPIRE', tombstone, tonumber(ARGV[2]))
+    end
+end
+"""
+# sets the entries unless a tombstone asks for a later version, a tombstone refusing "no such user" altogether
+STORE_SCRIPT = """
+for i = #KEYS / 2 + 1, #KEYS do
+    local version = redis.call('GET', KEYS[i])
+    if version and (ARGV[3] == '' or tonumber(ARGV[3]) < tonumber(version)) then
+        return 0
+    end
+end
+for i = 1, #KEYS / 2 do
+    redis.call('SET', KEYS[i], ARGV[1])
+    redis.call('EXPIRE', KEYS[i], tonumber(ARGV[2]))
+end
+return 1
+"""
+
+Record = Optional[Dict[str, Any]]
+
+
+class RecordEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder truncates to milliseconds, cached timestamps have to match the database's (see users.views)
+    def default(self, o: Any) -> Any:
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class LocalLRU:
+    """
+    Least recently used entries, each expiring `ttl` seconds after it was set.
+    """
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Tuple[bool, Record]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(key, None)
+                return False, None
+
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key: str, record: Record) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.record: Record = None
+
+
+class UserCache:
+    """
+    Read-through cache of users by username and by uuid: a local LRU, then redis, then postgres.
+
+    Records, including "no such user", are cached under both keys for `ttl` (`negative_ttl`) seconds in redis and
+    `local_ttl` seconds in process; `users.signals` invalidates them when a user is saved or deleted. Local entries
+    of other processes are not invalidated, `local_ttl` bounds how stale they can be.
+
+    An invalidation leaves tombstones for `ttl` seconds, refusing the entries older than the saved (or deleted) user:
+    a concurrent read that queried the row before the change cannot cache it after.
+
+    Concurrent misses of a key load it once: threads of a process wait for the one loading it, processes wait
+    (up to `lock_timeout`) for the one holding its redis lock. When redis fails, lookups go straight to postgres
+    for `retry_after` seconds.
+    """
+
+    def __init__(self, local_max_entries: int, local_ttl: float, ttl: int, negative_ttl: int, lock_timeout: float,
+                 retry_after: int, client: Callable[[], redis.StrictRedis] = get_redis) -> None:
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock_timeout = lock_timeout
+        self.retry_after = retry_after
+        self.local = LocalLRU(local_max_entries, local_ttl)
+        self._client = client
+        self._redis_down_until: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self._counters = {'local_hits': 0, 'redis_hits': 0, 'loads': 0, 'coalesced': 0}
+
+    @staticmethod
+    def key(field: str, value: str) -> str:
+        return f'user:v{VERSION}:{field}:{value}'
+
+    @staticmethod
+    def version(updated_at: datetime.datetime) -> int:
+        # microseconds, exact in the doubles of redis' lua
+        return int(updated_at.timestamp()) * 1000000 + updated_at.microsecond
+
+    def get_by_username(self, username: str) -> Optional[User]:
+        return self._get('username', username)
+
+    def get_by_uuid(self, uuid: str) -> Optional[User]:
+        return self._get('uuid', uuid)
+
+    def _redis_down(self, exc: Exception) -> None:
+        logger.warning('User cache unavailable, reading from the database: %s', exc)
+        self._redis_down_until = time.monotonic() + self.retry_after
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _get(self, field: str, value: str) -> Optional[User]:
+        key = self.key(field, value)
+
+        found, record = self.local.get(key)
+        if found:
+            self._count('local_hits')
+            return self._instance(record)
+
+        if self._redis_down_until is not None and time.monotonic() < self._redis_down_until:
+            return self._instance(self._query(field, value))
+
+        try:
+            cached = self._client().get(key)
+        except redis.RedisError as exc:
+            self._redis_down(exc)
+            return self._instance(self._query(field, value))
+
+        if cached is not None:
+            self._count('redis_hits')
+            record = self._loads(cached)
+            self.local.set(key, record)
+            return self._instance(record)
+
+        return self._instance(self._single_flight(key, field, value))
+
+    def _single_flight(self, key: str, field: str, value: str) -> Record:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = Flight()
+
+        if not leader:
+            if flight.done.wait(self.lock_timeout):
+                self._count('coalesced')
+                return flight.record
+            return self._query(field, value)
+
+        try:
+            flight.record = self._load(key, field, value)
+            return flight.record
+        finally:
+            flight.done.set()
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def _load(self, key: str, field: str, value: str) -> Record:
+        client, lock, token = self._client(), f'{key}:lock', secrets.token_hex(16)
+
+        try:
+            locked = client.set(lock, token, nx=True, px=int(self.lock_timeout * 1000))
+            if not locked:
+                cached = self._wait_for(key)
+                if cached is not None:
+                    self._count('coalesced')
+                    record = self._loads(cached)
+                    self.local.set(key, record)
+                    return record
+
+            record = self._query(field, value)
+            self._store(client, record, key)
+            if locked:
+                client.eval(RELEASE_SCRIPT, 1, lock, token)
+        except redis.RedisError as exc:
+            self._redis_down(exc)
+            record = self._query(field, value)
+
+        self.local.set(key, record)
+        return record
+
+    def _wait_for(self, key: str) -> Optional[bytes]:
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.005
+
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            cached = self._client().get(key)
+            if cached is not None:
+                return cached
+            delay = min(delay * 2, 0.05)
+        return None
+
+    def _query(self, field: str, value: str) -> Record:
+        self._count('loads')
+        return User.objects.filter(**{field: value}).values(*CACHED_FIELDS).first()
+
+    def _store(self, client: redis.StrictRedis, record: Record, key: str) -> None:
+        data = json.dumps(record, cls=RecordEncoder)
+
+        if record is None:
+            keys, ttl, version = [key], self.negative_ttl, ''
+        else:
+            # found by either key, cached under both
+            keys = [self.key(field, record[field]) for field in ('username', 'uuid')]
+            ttl, version = self.ttl, str(self.version(record['updated_at']))
+
+        tombstones = [f'{key}:tombstone' for key in keys]
+        client.eval(STORE_SCRIPT, len(keys) * 2, *keys, *tombstones, data, ttl, version)
+
+    @staticmethod
+    def _loads(cached: bytes) -> Record:
+        record = json.loads(cached.decode('utf-8'))
+        if record is not None:
+            for field in DATETIME_FIELDS:
+                record[field] = parse_datetime(record[field])
+        return record
+
+    @staticmethod
+    def _instance(record: Record) -> Optional[User]:
+        # a new instance on every call, callers are free to modify it
+        if record is None:
+            return None
+        return User.from_db('default', INSTANCE_FIELDS, [record[field] for field in INSTANCE_FIELDS])
+
+    def invalidate(self, user: User, deleted: bool = False) -> None:
+        keys = [self.key('username', user.username), self.key('uuid', user.uuid)]
+        tombstones = [f'{key}:tombstone' for key in keys]
+        # once deleted, not even the row as it last was
+        version = self.version(user.updated_at) + (1 if deleted else 0)
+
+        self.local.delete(*keys)
+        # attempted even while redis is taken as down, entries left behind would outlive the outage
+        try:
+            self._client().eval(INVALIDATE_SCRIPT, len(keys) * 2, *keys, *tombstones, version, self.ttl)
+        except redis.RedisError as exc:
+            if self._redis_down_until is None or time.monotonic() >= self._redis_down_until:
+                self._redis_down(exc)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+
+        # coalesced lookups were served without a query of their own
+        hits = counters['local_hits'] + counters['redis_hits'] + counters['coalesced']
+        lookups = hits + counters['loads']
+        return {**counters, 'hit_ratio': hits / lookups if lookups else 0.0}
+
+
+user_cache = UserCache(
+    local_max_entries=settings.USER_CACHE['LOCAL_MAX_ENTRIES'],
+    local_ttl=settings.USER_CACHE['LOCAL_TTL'],
+    ttl=settings.USER_CACHE['TTL'],
+    negative_ttl=settings.USER_CACHE['NEGATIVE_TTL'],
+    lock_timeout=settings.USER_CACHE['LOCK_TIMEOUT'],
+    retry_after=settings.USER_CACHE['RETRY_AFTER'],
+)
@@ -0,0 +1,46 @@
+from functools import lru_cache
+from typing import Tuple
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.template import Context, Engine, Template
+
+from .models import User
+
+
+CONFIRMATION_FROM_EMAIL = 'FootHub Team <no-reply@foothub.com>'
+CONFIRMATION_SUBJECT = 'FootHub Registration'
+CONFIRMATION_TEXT_BODY = 'Use the link to confirm email: {{ url }}'
+CONFIRMATION_HTML_BODY = '<p>Use the link to confirm email: <a href="{{ url }}">{{ url }}</a></p>'
+
+
+@lru_cache(maxsize=None)
+def confirmation_templates() -> Tuple[Template, Template, Template]:
+    """
+    Subject, text and html templates of the confirmation email, compiled once per process.
+    """
+    text_engine, html_engine = Engine(autoescape=False), Engine(autoescape=True)
+
+    return (
+        text_engine.from_string(CONFIRMATION_SUBJECT),
+        text_engine.from_string(CONFIRMATION_TEXT_BODY),
+        html_engine.from_string(CONFIRMATION_HTML_BODY),
+    )
+
+
+def confirmation_url(user: User) -> str:
+    return f'{settings.FRONTEND_URL}/confirm-registration?token={user.create_jwt()}'
+
+
+def confirmation_message(user: User) -> EmailMultiAlternatives:
+    subject, text_body, html_body = confirmation_templates()
+    context = Context({'user': user, 'url': confirmation_url(user)})
+
+    message = EmailMultiAlternatives(
+        subject=subject.render(context),
+        body=text_body.render(context),
+        from_email=CONFIRMATION_FROM_EMAIL,
+        to=[user.email],
+    )
+    message.attach_alternative(html_body.render(context), 'text/html')
+    return message
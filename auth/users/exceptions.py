@@ -0,0 +1,21 @@
+from rest_framework import exceptions, status
+from rest_framework.views import exception_handler as rest_exception_handler
+
+from .hashing import HashingUnavailable
+
+
+class ServiceUnavailable(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Service temporarily unavailable, try again later.'
+    default_code = 'service_unavailable'
+    wait = 1  # rendered as the Retry-After header
+
+
+def exception_handler(exc, context):
+    """
+    DRF's handler, answering errors of the layers below the views (model managers, authentication backends)
+    with their HTTP counterpart.
+    """
+    if isinstance(exc, HashingUnavailable):
+        exc = ServiceUnavailable(code='hashing_unavailable')
+    return rest_exception_handler(exc, context)
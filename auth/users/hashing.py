@@ -0,0 +1,150 @@
+import time
+import threading
+from functools import lru_cache
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.crypto import get_random_string
+
+from auth.metrics import LatencyHistogram
+
+
+class HashingUnavailable(Exception):
+    """
+    The executor is saturated, or did not hash in time; answered with a 503 by `users.exceptions`.
+    """
+
+
+class HashingExecutor:
+    """
+    Runs password hashing off the request thread, admitting at most `workers + max_queue` jobs at once.
+
+    Jobs over that limit are rejected straight away with `HashingUnavailable` instead of queueing behind a
+    login storm; so are jobs that wait longer than `timeout` seconds for their result.
+    """
+    BACKENDS: Dict[str, Callable[[int], Executor]] = {
+        'thread': lambda workers: ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hashing'),
+        'process': lambda workers: ProcessPoolExecutor(max_workers=workers),
+    }
+
+    def __init__(self, backend: str, workers: int, max_queue: int, timeout: float) -> None:
+        self.backend = backend
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+        self.in_flight = 0
+        self.rejected = 0
+        self.latency = LatencyHistogram()
+
+    @property
+    def executor(self) -> Executor:
+        # created on first use so that forked gunicorn workers do not share a pool with the master
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = self.BACKENDS[self.backend](self.workers)
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    def _release(self, started: float) -> None:
+        self.latency.observe(time.perf_counter() - started)
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def run(self, fn: Callable, *args: Any) -> Any:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingUnavailable()
+
+        with self._lock:
+            self.in_flight += 1
+
+        started = time.perf_counter()
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._release(started)
+            raise
+        future.add_done_callback(lambda _: self._release(started))
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingUnavailable()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'backend': self.backend,
+            'workers': self.workers,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'rejected': self.rejected,
+            'latency': self.latency.snapshot(),
+        }
+
+
+hashing_executor = HashingExecutor(
+    backend=settings.PASSWORD_HASHING['BACKEND'],
+    workers=settings.PASSWORD_HASHING['WORKERS'],
+    max_queue=settings.PASSWORD_HASHING['MAX_QUEUE'],
+    timeout=settings.PASSWORD_HASHING['TIMEOUT'],
+)
+
+
+def _verify_password(password: Optional[str], encoded: str) -> Tuple[bool, bool]:
+    must_update: List[bool] = []
+    is_correct = hashers.check_password(password, encoded, setter=lambda _: must_update.append(True))
+    return is_correct, bool(must_update)
+
+
+@lru_cache(maxsize=None)
+def dummy_password() -> str:
+    """
+    Hash of a random password, made once per process with the active hasher and its current parameters.
+    """
+    return hashers.make_password(get_random_string(32))
+
+
+def make_password(password: Optional[str]) -> str:
+    return hashing_executor.run(hashers.make_password, password)
+
+
+def set_password(user, password: Optional[str]) -> None:
+    """
+    Executor backed equivalent of `AbstractBaseUser.set_password`.
+    """
+    user.password = make_password(password)
+    user._password = password
+
+
+def check_password(user, password: Optional[str]) -> bool:
+    """
+    Executor backed equivalent of `AbstractBaseUser.check_password`, including the hash upgrade on success.
+    """
+    is_correct, must_update = hashing_executor.run(_verify_password, password, user.password)
+
+    if is_correct and must_update:
+        set_password(user, password)
+        user.save(update_fields=['password'])
+
+    return is_correct
+
+
+def check_dummy_password(password: Optional[str]) -> bool:
+    """
+    Burns the same time as `check_password` against an existing user, for lookups that found no one.
+    """
+    is_correct, _ = hashing_executor.run(_verify_password, password, dummy_password())
+    return is_correct
@@ -0,0 +1,27 @@
+import sys
+from typing import Optional
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.bulk import EXPORT_FIELDS, FORMATS, export_users
+
+from .import_users import guess_format
+
+
+class Command(BaseCommand):
+    help = f'Exports every user, as {", ".join(EXPORT_FIELDS)}, to a CSV (with a header) or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='file to write, stdout by default')
+        parser.add_argument('--format', choices=FORMATS, help='format of the file, guessed from its extension')
+
+    def handle(self, path: str, format: Optional[str], **options):
+        if path == '-':
+            export_users(sys.stdout, format or 'csv')
+            return
+
+        try:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                export_users(stream, format or guess_format(path))
+        except OSError as exc:
+            raise CommandError(exc)
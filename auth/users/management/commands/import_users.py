@@ -0,0 +1,44 @@
+import sys
+from typing import Optional
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.bulk import FORMATS, IMPORT_FIELDS, UserImporter, read_rows
+
+
+def guess_format(path: str) -> str:
+    return 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+class Command(BaseCommand):
+    help = (
+        f'Imports users from a CSV (with a header) or NDJSON file of {", ".join(IMPORT_FIELDS)}, the first three '
+        'required. Passwords may be plaintext or already hashed. Users conflicting with existing ones are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='file to import, - for stdin')
+        parser.add_argument('--format', choices=FORMATS, help='format of the file, guessed from its extension')
+        parser.add_argument('--batch-size', type=int, default=10000, help='rows copied per transaction')
+        parser.add_argument('--workers', type=int, help='processes hashing plaintext passwords, one per cpu')
+
+    def reject(self, line: int, message: str) -> None:
+        self.stderr.write(f'line {line}: {message}')
+
+    def handle(self, path: str, format: Optional[str], batch_size: int, workers: Optional[int], **options):
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        fmt = format or guess_format(path)
+        importer = UserImporter(batch_size=batch_size, workers=workers, reject=self.reject)
+
+        if path == '-':
+            counters = importer.run(read_rows(sys.stdin, fmt))
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8') as stream:
+                    counters = importer.run(read_rows(stream, fmt))
+            except OSError as exc:
+                raise CommandError(exc)
+
+        self.stdout.write(', '.join(f'{count} {name}' for name, count in counters.items()))
@@ -0,0 +1,51 @@
+from typing import List, Set, Tuple
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.utils import ProgrammingError
+
+
+Key = Tuple[str, str]
+
+
+def applied_migrations(connection) -> Set[Key]:
+    # in a single query, a missing table meaning that nothing was applied yet
+    table = connection.ops.quote_name(MigrationRecorder.Migration._meta.db_table)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT app, name FROM {table}')
+            return set(cursor.fetchall())
+    except ProgrammingError:
+        return set()
+
+
+def pending_migrations(connection) -> List[Key]:
+    # the migrations on disk, without the queries `migrate` makes to plan them
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    applied = applied_migrations(connection)
+
+    pending = set(loader.graph.nodes) - applied
+    # a squashed migration is applied once all the migrations it replaces are
+    for key, migration in loader.replacements.items():
+        if set(migration.replaces) <= applied:
+            pending.discard(key)
+    return sorted(pending)
+
+
+class Command(BaseCommand):
+    help = 'Applies the pending migrations, if any: a schema already up to date costs a single query.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='database to migrate, "default" by default')
+
+    def handle(self, database: str, **options):
+        pending = pending_migrations(connections[database])
+        if not pending:
+            self.stdout.write('No migrations to apply.')
+            return
+
+        self.stdout.write(f'Applying {len(pending)} migrations.')
+        call_command('migrate', database=database, interactive=False, verbosity=options['verbosity'])
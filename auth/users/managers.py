@@ -1,5 +1,7 @@
 from django.contrib.auth.base_user import BaseUserManager
 
+from . import hashing
+
 
 class UserManager(BaseUserManager):
     use_in_migrations = True
@@ -7,6 +9,6 @@ class UserManager(BaseUserManager):
     def create_user(self, email, username, password, **extra_fields):
         email = self.normalize_email(email)
         user = self.model(email=email, username=username, **extra_fields)
-        user.set_password(password)
+        hashing.set_password(user, password)
         user.save(using=self._db)
         return user
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # indexes are built concurrently so that existing deployments keep serving logins meanwhile
+    atomic = False
+
+    dependencies = [
+        ('users', '0002_user_email_confirmed'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS users_user_email_lower_idx ON users_user (lower(email));',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS users_user_email_lower_idx;',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS users_user_username_lower_idx ON users_user (lower(username));',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS users_user_username_lower_idx;',
+        ),
+    ]
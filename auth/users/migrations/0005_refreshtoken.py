@@ -0,0 +1,27 @@
+# Generated by Django 2.1.3 on 2026-10-18 04:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+import users.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token_hash', models.CharField(max_length=64, unique=True)),
+                ('family', models.CharField(db_index=True, default=users.models.get_default_uuid, max_length=32)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('revoked', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='refresh_tokens', to='users.User')),
+            ],
+        ),
+    ]
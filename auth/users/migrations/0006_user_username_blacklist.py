@@ -0,0 +1,19 @@
+# Generated by Django 2.1.3 on 2026-10-18 05:16
+
+from django.db import migrations, models
+import users.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_refreshtoken'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='username',
+            field=models.CharField(max_length=30, unique=True, validators=[users.models.UnicodeUsernameValidator(), users.models.BlackListValidator(['me', 'batch'])]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.1.3 on 2026-10-18 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # built concurrently, as the indexes of 0003, so that existing deployments keep serving meanwhile
+    atomic = False
+
+    dependencies = [
+        ('users', '0006_user_username_blacklist'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS users_user_updated_id_idx '
+                        'ON users_user (updated_at, id);',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS users_user_updated_id_idx;',
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='user',
+                    index=models.Index(fields=['updated_at', 'id'], name='users_user_updated_id_idx'),
+                ),
+            ],
+        ),
+    ]
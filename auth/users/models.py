@@ -1,6 +1,8 @@
 import uuid
 
 from django.db import models
+from django.contrib.postgres.fields import JSONField
+from django.db.models.functions import Lower
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
 from django.contrib.auth.base_user import AbstractBaseUser
@@ -30,6 +32,25 @@ class BlackListValidator:
             raise ValidationError(self.MESSAGE, self.CODE)
 
 
+# enables `<field>__lower=` lookups, served by the lower() expression indexes of migration 0003
+models.CharField.register_lookup(Lower)
+
+
+@models.CharField.register_lookup
+class Any(models.Lookup):
+    """
+    `<field>__any=[...]`, as `field = ANY(%s)` with the list as a single array parameter: unlike `__in`, the SQL
+    is the same whatever the number of values.
+    """
+    lookup_name = 'any'
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} = ANY({rhs})', lhs_params + rhs_params
+
+
 UUID4HEX_LEN = 32
 
 
@@ -42,7 +63,7 @@ class User(AbstractBaseUser):
     EMAIL_FIELD = 'email'
     REQUIRED_FIELDS = ['email']
 
-    BLACKLISTED_USERNAMES = ['me']
+    BLACKLISTED_USERNAMES = ['me', 'batch']
 
     USERNAME_MAX_LEN = 30
 
@@ -78,6 +99,12 @@ class User(AbstractBaseUser):
 
     objects = UserManager()
 
+    class Meta:
+        indexes = [
+            # keyset pagination of the users listing, see users.pagination
+            models.Index(fields=['updated_at', 'id'], name='users_user_updated_id_idx'),
+        ]
+
     def create_jwt(self) -> str:
         payload = api_settings.JWT_PAYLOAD_HANDLER(self)
         return api_settings.JWT_ENCODE_HANDLER(payload)
@@ -103,3 +130,53 @@ class PhoneNumber(models.Model):
 
     class Meta:
         ordering = ['-id']
+
+
+class OutboxEvent(models.Model):
+    """
+    Celery task waiting to be published, written in the same transaction as the change that triggers it.
+
+    `users.tasks.relay_outbox` publishes pending events in batches and deletes them; `idempotency_key` becomes
+    the task id, so an event published twice is the same task to consumers and result backends, and runs once
+    (see `users.tasks.OutboxTask`).
+    """
+    TASK_MAX_LEN = 128
+
+    task = models.CharField(max_length=TASK_MAX_LEN)
+    kwargs = JSONField(default=dict)
+
+    idempotency_key = models.CharField(
+        max_length=UUID4HEX_LEN,
+        editable=False,
+        unique=True,
+        default=get_default_uuid
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+
+class RefreshToken(models.Model):
+    """
+    Opaque refresh token, stored as the sha256 digest of its value.
+
+    Each use revokes the token and issues its successor in the same `family`; presenting a revoked token means it
+    was stolen or replayed, and revokes the whole family. See `jwt_utils.refresh`.
+    """
+    TOKEN_HASH_LEN = 64
+
+    user = models.ForeignKey(
+        to='users.User',
+        on_delete=models.CASCADE,
+        related_name='refresh_tokens',
+        null=False
+    )
+
+    token_hash = models.CharField(max_length=TOKEN_HASH_LEN, unique=True)
+    family = models.CharField(max_length=UUID4HEX_LEN, db_index=True, default=get_default_uuid)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked = models.BooleanField(default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
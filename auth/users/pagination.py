@@ -0,0 +1,107 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework import exceptions, pagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .models import User
+
+
+Position = Tuple[datetime, int]
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Users in (updated_at, id) order, each page starting right after the last user of the previous one.
+
+    Pages are read from the `users_user_updated_id_idx` index, so every page costs the same however deep it is.
+    Responses carry a `cursor`, the position after their last user, that a consumer keeps to fetch the users
+    changed since; `since` starts the listing at a point in time instead.
+
+    Users saved by transactions still running when a page is read may later show up with an `updated_at` behind
+    that page's cursor, consumers re-reading a short overlap (through `since`) do not miss them. Deleted users
+    are not listed.
+    """
+    cursor_query_param = 'cursor'
+    since_query_param = 'since'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def __init__(self) -> None:
+        self.page_size = api_settings.PAGE_SIZE
+        self.request = None
+        self.position: Optional[Position] = None
+        self.has_next = False
+
+    @staticmethod
+    def encode_cursor(position: Position) -> str:
+        updated_at, pk = position
+        return base64.urlsafe_b64encode(f'{updated_at.isoformat()}|{pk}'.encode()).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Position:
+        try:
+            updated_at, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode().split('|')
+            position = parse_datetime(updated_at), int(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise exceptions.NotFound('Invalid cursor.')
+
+        if position[0] is None:
+            raise exceptions.NotFound('Invalid cursor.')
+        return position  # type: ignore
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None) -> List[User]:
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        since = request.query_params.get(self.since_query_param)
+
+        if cursor:
+            self.position = updated_at, pk = self.decode_cursor(cursor)
+            # (updated_at, id) > position, spelled out so that the index range starts at `updated_at`
+            queryset = queryset.filter(updated_at__gte=updated_at).filter(Q(updated_at__gt=updated_at) | Q(id__gt=pk))
+        elif since:
+            try:
+                # None when malformed, ValueError when well formed but out of range (2020-13-40T00:00)
+                since_at = parse_datetime(since)
+            except ValueError:
+                since_at = None
+            if since_at is None:
+                raise exceptions.ValidationError({self.since_query_param: 'Invalid datetime.'})
+            queryset = queryset.filter(updated_at__gte=since_at)
+
+        users = list(queryset.order_by('updated_at', 'id')[:page_size + 1])
+
+        self.has_next = len(users) > page_size
+        users = users[:page_size]
+        if users:
+            self.position = users[-1].updated_at, users[-1].id
+        return users
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()  # type: ignore
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.position))  # type: ignore
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({
+            'next': self.get_next_link(),
+            'cursor': self.encode_cursor(self.position) if self.position is not None else None,
+            'results': data,
+        })
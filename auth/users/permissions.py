@@ -9,4 +9,4 @@ class UserPermissions(permissions.BasePermission):
         return request.user is not None
 
     def has_object_permission(self, request, view, obj):
-        return request.user is not None and obj.id == request.user.id
+        return request.user is not None and obj.uuid == request.user.uuid
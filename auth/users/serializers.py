@@ -1,6 +1,7 @@
+from django.conf import settings
 from rest_framework import serializers
 
-from .models import User
+from .models import User, UUID4HEX_LEN
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -16,15 +17,25 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('uuid', 'username', 'email', 'password')
 
 
-UserJwtPayloadSerializer = UserSerializer
+class UserListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('uuid', 'username', 'updated_at')
 
 
-class ConfirmEmailSerializer(serializers.ModelSerializer):
-    token = serializers.SerializerMethodField()
+class UserBatchSerializer(serializers.Serializer):
+    uuids = serializers.ListField(child=serializers.CharField(max_length=UUID4HEX_LEN), default=list)
+    usernames = serializers.ListField(child=serializers.CharField(max_length=User.USERNAME_MAX_LEN), default=list)
 
-    def get_token(self, obj: User):
-        return obj.create_jwt()
+    def validate(self, data):
+        data = {field: sorted(set(values)) for field, values in data.items()}
+        size = len(data['uuids']) + len(data['usernames'])
 
-    class Meta:
-        model = User
-        fields = ('email', 'token')
+        if size == 0:
+            raise serializers.ValidationError('Provide uuids or usernames.')
+        if size > settings.USER_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(f'At most {settings.USER_BATCH_MAX_SIZE} users per request.')
+        return data
+
+
+UserJwtPayloadSerializer = UserSerializer
@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import user_cache
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance: User, signal, **kwargs) -> None:
+    # again once committed, as a concurrent read may have cached the row as it was before the transaction
+    deleted = signal is post_delete
+    user_cache.invalidate(instance, deleted)
+    transaction.on_commit(lambda: user_cache.invalidate(instance, deleted))
@@ -0,0 +1,91 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+
+class SubscriberMetrics:
+    """
+    Per subscriber delivery counters and latencies, kept for the lifetime of the process.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Dict[str, Any]] = {}
+
+    def observe(self, subscriber: str, seconds: float, delivered: bool) -> None:
+        with self._lock:
+            metrics = self._subscribers.setdefault(
+                subscriber, {'deliveries': 0, 'failures': 0, 'latency_sum': 0.0, 'latency_max': 0.0})
+            metrics['deliveries' if delivered else 'failures'] += 1
+            metrics['latency_sum'] += seconds
+            metrics['latency_max'] = max(metrics['latency_max'], seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {subscriber: dict(metrics) for subscriber, metrics in self._subscribers.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._subscribers.clear()
+
+
+metrics = SubscriberMetrics()
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_session() -> requests.Session:
+    """
+    Process wide session, so that deliveries reuse keep-alive connections to each subscriber.
+    """
+    global _session
+
+    with _lock:
+        if _session is None:
+            pool_size = settings.REGISTRATION_BROADCAST['POOL_SIZE']
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+
+        return _session
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.REGISTRATION_BROADCAST['POOL_SIZE'], thread_name_prefix='broadcast')
+
+        return _executor
+
+
+def deliver(subscriber: str, token: str) -> bool:
+    started = time.perf_counter()
+    try:
+        response = get_session().post(
+            url=subscriber, json={'token': token}, timeout=settings.REGISTRATION_BROADCAST['TIMEOUT'])
+        delivered = response.status_code == 201
+    except requests.RequestException:
+        delivered = False
+
+    metrics.observe(subscriber, time.perf_counter() - started, delivered)
+    return delivered
+
+
+def broadcast(subscribers: Iterable[str], token: str) -> Dict[str, bool]:
+    """
+    Delivers `token` to every subscriber concurrently, returning whether each delivery succeeded.
+    """
+    subscribers = list(subscribers)
+    results = get_executor().map(lambda subscriber: deliver(subscriber, token), subscribers)
+    return dict(zip(subscribers, results))
@@ -1,50 +1,277 @@
-from typing import Dict, Any
+import uuid
+import logging
+import smtplib
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from django.core.mail import send_mail
+import redis
+from django.core.mail import get_connection
 from django.conf import settings
-from celery import shared_task
+from django.db import transaction
+from django.utils import timezone
+from celery import Task, shared_task, current_app
+from celery.utils.time import get_exponential_backoff_interval
 from rest_framework_jwt.settings import api_settings
-from requests import post
 
-from .models import User
-from .serializers import ConfirmEmailSerializer
+from auth.redis_client import get_redis
+# `emails` and `subscribers` (with `requests`) are only imported by the tasks that use them, which run in celery
+# workers: web processes just import this module to enqueue
+from .models import User, OutboxEvent, RefreshToken
 
 
-@shared_task
-def broadcast_registration(uuid: str, username: str) -> bool:
-    subscribers = [
-        'http://core:8000/profiles',
-    ]
+logger = logging.getLogger(__name__)
+
+# columns read to sign and address a confirmation email
+CONFIRMATION_FIELDS = ('uuid', 'username', 'email', 'email_confirmed')
+
+# argument of the idempotency keys of the outbox events a task is published for, see OutboxTask
+OUTBOX_KEYS_KWARG = 'outbox_keys'
+OUTBOX_KEY_PREFIX = 'outbox:'
+
+
+def _claim_outbox_keys(keys: List[str]) -> Dict[str, bool]:
+    try:
+        with get_redis().pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(f'{OUTBOX_KEY_PREFIX}{key}', 'running', nx=True, ex=settings.OUTBOX['CLAIM_TTL'])
+            return {key: bool(claimed) for key, claimed in zip(keys, pipe.execute())}
+    except redis.RedisError as exc:
+        logger.warning('Outbox keys unavailable, running the task anyway: %s', exc)
+        return {key: True for key in keys}
+
+
+def _settle_outbox_keys(keys: List[str], done: bool) -> None:
+    try:
+        with get_redis().pipeline(transaction=False) as pipe:
+            for key in keys:
+                if done:
+                    pipe.set(f'{OUTBOX_KEY_PREFIX}{key}', 'done', ex=settings.OUTBOX['DEDUPLICATION_TTL'])
+                else:
+                    pipe.delete(f'{OUTBOX_KEY_PREFIX}{key}')
+            pipe.execute()
+    except redis.RedisError as exc:
+        logger.warning('Outbox keys unavailable: %s', exc)
+
+
+class OutboxTask(Task):
+    """
+    Base of the tasks published by `relay_outbox`, which runs them once per outbox event however many times the
+    event is relayed or its message delivered.
+
+    The idempotency keys of the events come along with the arguments (in `outbox_keys`), one per item of the
+    `outbox_batch_kwarg` list for batch tasks. Keys are claimed in redis before the task runs, and remembered
+    for `DEDUPLICATION_TTL` seconds once it succeeds; events whose keys are claimed already are left out. Keys
+    are released when the task fails or retries, so that its next attempt runs. With redis unavailable, tasks
+    run regardless: events are then delivered at least once.
+    """
+    outbox_batch_kwarg: Optional[str] = None
+    outbox_batch_size = 1
+
+    def __call__(self, *args, **kwargs):
+        keys = kwargs.pop(OUTBOX_KEYS_KWARG, None)
+        if keys is None:
+            return super().__call__(*args, **kwargs)
+
+        claimed = _claim_outbox_keys(list(OrderedDict.fromkeys(keys)))
+        if self.outbox_batch_kwarg is None:
+            if not all(claimed.values()):
+                return None
+        else:
+            items = [item for item, key in zip(kwargs[self.outbox_batch_kwarg], keys) if claimed[key]]
+            if not items:
+                return None
+            kwargs[self.outbox_batch_kwarg] = items
+
+        owned = [key for key, ok in claimed.items() if ok]
+        try:
+            result = super().__call__(*args, **kwargs)
+        except BaseException:
+            _settle_outbox_keys(owned, done=False)
+            raise
+
+        _settle_outbox_keys(owned, done=True)
+        return result
 
-    responses = []
+
+def _retry_countdown(retries: int, config: Dict[str, Any]) -> int:
+    return get_exponential_backoff_interval(
+        factor=config['RETRY_BACKOFF'],
+        retries=retries,
+        maximum=config['RETRY_BACKOFF_MAX'],
+        full_jitter=True,
+    )
+
+
+@shared_task(bind=True, max_retries=settings.REGISTRATION_BROADCAST['MAX_RETRIES'])
+def notify_subscriber(self, subscriber: str, token: str) -> bool:
+    from . import subscribers
+
+    if not subscribers.deliver(subscriber, token):
+        countdown = _retry_countdown(self.request.retries + 1, settings.REGISTRATION_BROADCAST)
+        raise self.retry(countdown=countdown)
+
+    return True
+
+
+@shared_task(base=OutboxTask)
+def broadcast_registration(uuid: str, username: str) -> bool:
+    from . import subscribers
 
     signed_user_uuid = api_settings.JWT_ENCODE_HANDLER({
         'uuid': uuid,
         'username': username,
     })
 
-    for subscriber in subscribers:
-        responses.append(post(url=subscriber, json={'token': signed_user_uuid}))
+    delivered = subscribers.broadcast(settings.REGISTRATION_SUBSCRIBERS, signed_user_uuid)
 
-    return all([response.status_code == 201 for response in responses])
+    # failed subscribers are retried on their own, with exponential backoff, without holding up the others
+    for subscriber in [subscriber for subscriber, ok in delivered.items() if not ok]:
+        notify_subscriber.apply_async(
+            args=(subscriber, signed_user_uuid), countdown=_retry_countdown(0, settings.REGISTRATION_BROADCAST))
 
+    return all(delivered.values())
 
-@shared_task
-def send_confirmation_email(user: Dict[str, Any]) -> bool:
-    url = f'{settings.FRONTEND_URL}/confirm-registration'
-    message = f'Use the link to confirm email: {url}?token={user["token"]}'
-
-    sent_mails = send_mail(
-        subject='FootHub Registration',
-        message=message,
-        from_email='FootHub Team <no-reply@foothub.com>',
-        recipient_list=[user['email']],
-        fail_silently=False,
-    )
+
+def _unconfirmed_users(uuids: List[str]) -> List[User]:
+    return list(User.objects.only(*CONFIRMATION_FIELDS).filter(uuid__in=uuids, email_confirmed=False))
+
+
+@shared_task(bind=True, max_retries=settings.CONFIRMATION_EMAIL['MAX_RETRIES'])
+def send_confirmation_email(self, uuid: str) -> bool:
+    from . import emails
+
+    users = _unconfirmed_users([uuid])
+    if not users:
+        return False
+
+    try:
+        sent_mails = emails.confirmation_message(users[0]).send(fail_silently=False)
+    except (smtplib.SMTPException, OSError) as exc:
+        raise self.retry(exc=exc, countdown=_retry_countdown(self.request.retries + 1, settings.CONFIRMATION_EMAIL))
 
     return sent_mails == 1
 
 
+@shared_task(base=OutboxTask, bind=True, max_retries=settings.CONFIRMATION_EMAIL['MAX_RETRIES'],
+             outbox_batch_kwarg='uuids', outbox_batch_size=settings.CONFIRMATION_EMAIL['BATCH_SIZE'])
+def send_confirmation_emails(self, uuids: List[str]) -> Dict[str, bool]:
+    """
+    Sends a batch of confirmation emails over a single SMTP session.
+
+    Confirmation links are signed here, in the worker. Messages the server refuses are retried one by one through
+    `send_confirmation_email`; the outcome of each message is returned, keyed by user uuid.
+    """
+    from . import emails
+
+    users = _unconfirmed_users(uuids)
+    if not users:
+        return {}
+
+    connection = get_connection(fail_silently=False)
+
+    try:
+        connection.open()
+    except (smtplib.SMTPException, OSError) as exc:
+        raise self.retry(exc=exc, countdown=_retry_countdown(self.request.retries + 1, settings.CONFIRMATION_EMAIL))
+
+    outcomes = {}
+    try:
+        for user in users:
+            try:
+                outcomes[user.uuid] = connection.send_messages([emails.confirmation_message(user)]) == 1
+            except (smtplib.SMTPException, OSError):
+                outcomes[user.uuid] = False
+
+            if not outcomes[user.uuid]:
+                send_confirmation_email.apply_async(
+                    kwargs={'uuid': user.uuid}, countdown=_retry_countdown(0, settings.CONFIRMATION_EMAIL))
+    finally:
+        connection.close()
+
+    return outcomes
+
+
+def _outbox_publications(events: List[OutboxEvent]) -> Iterator[Tuple[str, Dict[str, Any], str]]:
+    """
+    Yields (task, kwargs, task id) for each publication due, merging the events of batch tasks.
+
+    A task declared with `outbox_batch_kwarg` takes a list in that argument; its pending events are concatenated
+    into calls of at most `outbox_batch_size` items, identified by a key derived from the merged events' keys.
+    Tasks based on `OutboxTask` are also given the keys of their events, to run each event once.
+    """
+    batches: Dict[str, List[OutboxEvent]] = OrderedDict()
+
+    for event in events:
+        task = current_app.tasks.get(event.task)
+        if getattr(task, 'outbox_batch_kwarg', None) is None:
+            kwargs = event.kwargs
+            if isinstance(task, OutboxTask):
+                kwargs = {**kwargs, OUTBOX_KEYS_KWARG: [event.idempotency_key]}
+            yield event.task, kwargs, event.idempotency_key
+        else:
+            batches.setdefault(event.task, []).append(event)
+
+    for task_name, batch_events in batches.items():
+        task = current_app.tasks[task_name]
+        kwarg, size = task.outbox_batch_kwarg, task.outbox_batch_size
+        items = [(item, event.idempotency_key) for event in batch_events for item in event.kwargs[kwarg]]
+
+        for i in range(0, len(items), size):
+            chunk = items[i:i + size]
+            keys = [key for _, key in chunk]
+            task_id = uuid.uuid5(uuid.NAMESPACE_OID, ','.join(keys)).hex
+            yield task_name, {kwarg: [item for item, _ in chunk], OUTBOX_KEYS_KWARG: keys}, task_id
+
+
+@shared_task
+def relay_outbox() -> int:
+    """
+    Publishes pending outbox events in batches, over one broker connection per batch.
+    """
+    published = 0
+
+    while True:
+        with transaction.atomic():
+            events = list(OutboxEvent.objects.select_for_update(skip_locked=True)[:settings.OUTBOX['BATCH_SIZE']])
+
+            if events:
+                with current_app.producer_or_acquire() as producer:
+                    for task_name, kwargs, task_id in _outbox_publications(events):
+                        current_app.send_task(task_name, kwargs=kwargs, task_id=task_id, producer=producer)
+
+                OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+
+        published += len(events)
+        if len(events) < settings.OUTBOX['BATCH_SIZE']:
+            return published
+
+
+@shared_task
+def purge_refresh_tokens() -> int:
+    """
+    Deletes expired refresh tokens in batches, keeping each delete short. Revoked tokens are kept until they
+    expire, as they are needed to detect reuse.
+    """
+    batch_size = settings.REFRESH_TOKEN['PURGE_BATCH_SIZE']
+    expired = RefreshToken.objects.filter(expires_at__lte=timezone.now()).order_by()
+    purged = 0
+
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        deleted, _ = RefreshToken.objects.filter(id__in=ids).delete()
+        purged += deleted
+
+        if deleted < batch_size:
+            return purged
+
+
+def request_confirmation_email(user: User) -> None:
+    OutboxEvent.objects.create(task=send_confirmation_emails.name, kwargs={'uuids': [user.uuid]})
+
+
 def on_create(user: User) -> None:
-    broadcast_registration.delay(uuid=user.uuid, username=user.username)
-    send_confirmation_email.delay(user=ConfirmEmailSerializer(user).data)
+    # must run in the transaction that creates the user, publishing is left to relay_outbox
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(task=broadcast_registration.name, kwargs={'uuid': user.uuid, 'username': user.username}),
+        OutboxEvent(task=send_confirmation_emails.name, kwargs={'uuids': [user.uuid]}),
+    ])
@@ -1,18 +1,50 @@
+import io
+import os
+import csv
 import json
+import time
+import threading
+import tempfile
+import tracemalloc
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn, TCPServer, StreamRequestHandler
 from typing import Optional
 from unittest.mock import patch
 
-from django.contrib.auth import authenticate
+from django.contrib.auth import authenticate, hashers
 from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
 from django.conf import settings
-from django.test import TestCase, override_settings
-from rest_framework.test import APITestCase
+from django.utils import timezone
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 from rest_framework_jwt.settings import api_settings
 from jwt import ExpiredSignature, DecodeError
-
-from .models import User
-from .serializers import ConfirmEmailSerializer
-from .tasks import broadcast_registration, send_confirmation_email, on_create
+from celery.exceptions import Retry
+import redis
+import fakeredis
+
+from auth.testing import APITestCase, TestCase, benchmark
+
+from . import emails, subscribers
+from .backends import UsernameEmailModelBackend
+from .bulk import FORMATS, UserImporter, export_users, read_rows
+from .cache import CACHED_FIELDS, UserCache, user_cache
+from .exceptions import ServiceUnavailable, exception_handler
+from .hashing import HashingExecutor, HashingUnavailable, dummy_password
+from .throttling import LocalBuckets, RateLimiter, parse_rate
+from .models import User, OutboxEvent, RefreshToken
+from .pagination import KeysetPagination
+from .serializers import UserSerializer
+from .tasks import (
+    broadcast_registration, notify_subscriber, send_confirmation_email, send_confirmation_emails, on_create,
+    relay_outbox, request_confirmation_email, purge_refresh_tokens
+)
 
 
 USER_VASCO = {
@@ -28,8 +60,106 @@ USER_JOAO = {
 }
 
 
+class StubSubscriber(ThreadingMixIn, HTTPServer):
+    """
+    Local HTTP server standing in for a registration subscriber.
+    """
+    daemon_threads = True
+
+    def __init__(self, status_code=201, delay=0.0):
+        self.status_code = status_code
+        self.delay = delay
+        self.received = []
+        self.connections = set()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(handler):
+                body = handler.rfile.read(int(handler.headers['Content-Length']))
+                self.received.append(json.loads(body))
+                self.connections.add(handler.client_address)
+                time.sleep(self.delay)
+
+                handler.send_response(self.status_code)
+                handler.send_header('Content-Length', '0')
+                handler.end_headers()
+
+            def log_message(handler, *args):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/profiles'
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class StubSMTPServer(ThreadingMixIn, TCPServer):
+    """
+    Local SMTP server accepting every message, except those for `refused` recipients.
+    """
+    daemon_threads = True
+
+    def __init__(self, refused=()):
+        self.refused = refused
+        self.messages = []
+        self.connections = 0
+
+        class Handler(StreamRequestHandler):
+            def reply(handler, line):
+                handler.wfile.write(f'{line}\r\n'.encode())
+
+            def handle(handler):
+                self.connections += 1
+                handler.reply('220 stub')
+
+                for line in handler.rfile:
+                    command = line.decode().strip()
+                    verb = command[:4].upper()
+
+                    if verb == 'RCPT' and any(recipient in command for recipient in self.refused):
+                        handler.reply('550 refused')
+                    elif verb == 'DATA':
+                        handler.reply('354 go ahead')
+                        self.messages.append(b''.join(iter(handler.rfile.readline, b'.\r\n')))
+                        handler.reply('250 OK')
+                    elif verb == 'QUIT':
+                        handler.reply('221 bye')
+                        return
+                    else:
+                        handler.reply('250 OK')
+
+        super().__init__(('127.0.0.1', 0), Handler)
+
+    @property
+    def settings(self):
+        return {
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': '127.0.0.1',
+            'EMAIL_PORT': self.server_address[1],
+        }
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
 class TestUserBackend(TestCase):
     def setUp(self):
+        super().setUp()
         User.objects.create_user(**USER_VASCO)
         User.objects.create_user(**USER_JOAO)
 
@@ -51,6 +181,193 @@ class TestUserBackend(TestCase):
     def test_email_authentication_success(self):
         self.assertIsNotNone(authenticate(username=USER_VASCO['email'], password=USER_VASCO['password']))
 
+    def test_case_insensitive_authentication_success(self):
+        self.assertIsNotNone(authenticate(username=USER_VASCO['username'].upper(), password=USER_VASCO['password']))
+        self.assertIsNotNone(authenticate(username=USER_VASCO['email'].upper(), password=USER_VASCO['password']))
+
+    def test_case_insensitive_authentication_prefers_exact_match(self):
+        user_vasco_lower = User.objects.create_user(
+            email='other@foothub.com', username=USER_VASCO['username'].lower(), password=USER_JOAO['password'])
+
+        self.assertEqual(
+            authenticate(username=user_vasco_lower.username, password=USER_JOAO['password']), user_vasco_lower)
+        self.assertIsNone(authenticate(username=USER_VASCO['username'].upper(), password=USER_VASCO['password']))
+
+    def test_case_insensitive_authentication_three_variants(self):
+        variants = [
+            User.objects.create_user(email=f'{username}@chi.com', username=username, password=USER_JOAO['password'])
+            for username in ('chi', 'Chi', 'CHI')
+        ]
+
+        for user in variants:
+            self.assertEqual(authenticate(username=user.username, password=USER_JOAO['password']), user)
+        self.assertIsNone(authenticate(username='cHi', password=USER_JOAO['password']))
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            user = authenticate(username=USER_VASCO['email'], password=USER_VASCO['password'])
+
+        self.assertEqual(
+            user.get_deferred_fields(), {'last_login', 'email_confirmed', 'updated_at', 'created_at'})
+
+
+class TestUserLoginIndexes(TestCase):
+    SEED_ROWS = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO users_user (password, uuid, email, username, email_confirmed, updated_at, created_at)
+                SELECT '!', md5(i::text), 'user' || i || '@foothub.com', 'user' || i, false, now(), now()
+                FROM generate_series(1, %s) AS i
+                """,
+                [cls.SEED_ROWS]
+            )
+            cursor.execute('ANALYZE users_user')
+
+    def setUp(self):
+        super().setUp()
+        # a table this small would rather be scanned: plans are checked for the index being usable at all
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def test_email_lookup_uses_index(self):
+        plan = UsernameEmailModelBackend.login_queryset('User42@FootHub.com').explain()
+        self.assertIn('users_user_email_lower_idx', plan)
+
+    def test_username_lookup_uses_index(self):
+        plan = UsernameEmailModelBackend.login_queryset('USER42').explain()
+        self.assertIn('users_user_username_lower_idx', plan)
+
+    def test_listing_page_uses_index(self):
+        request = APIRequestFactory().get('/users', {'cursor': KeysetPagination.encode_cursor((timezone.now(), 42))})
+        paginator = KeysetPagination()
+
+        with CaptureQueriesContext(connection) as queries:
+            paginator.paginate_queryset(User.objects.all(), Request(request))
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {queries[0]["sql"]}')
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('users_user_updated_id_idx', plan)
+
+
+class TestUserBackendTiming(TestCase):
+    ROUNDS = 10
+
+    def setUp(self):
+        super().setUp()
+        self.user_vasco = User.objects.create_user(**USER_VASCO)
+        dummy_password()
+
+    def _measure(self):
+        # alternate both paths so that CPU frequency and cache drift affect them alike
+        elapsed = {'hit': [0.0, 0.0], 'miss': [0.0, 0.0]}
+        for _ in range(self.ROUNDS):
+            for path, username in (('hit', USER_VASCO['username']), ('miss', 'unknown')):
+                wall, cpu = time.perf_counter(), time.process_time()
+                self.assertIsNone(authenticate(username=username, password=USER_JOAO['password']))
+                elapsed[path][0] += time.perf_counter() - wall
+                elapsed[path][1] += time.process_time() - cpu
+        return elapsed['hit'], elapsed['miss']
+
+    def test_dummy_password_parameters(self):
+        hasher = hashers.identify_hasher(dummy_password())
+        self.assertEqual(hasher.algorithm, hashers.get_hasher().algorithm)
+        self.assertFalse(hasher.must_update(dummy_password()))
+        self.assertEqual(dummy_password(), dummy_password())
+
+    def test_miss_skips_salt_and_hash_generation(self):
+        with patch('users.hashing.hashers.make_password') as mock:
+            self.assertIsNone(authenticate(username='unknown', password=USER_VASCO['password']))
+            mock.assert_not_called()
+
+    def test_hit_and_miss_verify_alike(self):
+        # one verification each, against hashes of the same hasher and parameters
+        with patch('users.hashing.hashers.check_password', return_value=False) as mock:
+            for username in (USER_VASCO['username'], 'unknown'):
+                self.assertIsNone(authenticate(username=username, password=USER_JOAO['password']))
+
+        (_, hit_hash), _ = mock.call_args_list[0]
+        (_, miss_hash), _ = mock.call_args_list[1]
+        self.assertEqual(mock.call_count, 2)
+        # algorithm and iterations
+        self.assertEqual(hit_hash.split('$')[:2], miss_hash.split('$')[:2])
+
+    @benchmark
+    def test_benchmark(self):
+        (hit_wall, hit_cpu), (miss_wall, miss_cpu) = self._measure()
+
+        print(f'\n{self.ROUNDS} failed logins: hit {hit_wall:.3f}s wall / {hit_cpu:.3f}s cpu, '
+              f'miss {miss_wall:.3f}s wall / {miss_cpu:.3f}s cpu')
+
+
+class TestHashingExecutor(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.executor = HashingExecutor(backend='thread', workers=1, max_queue=1, timeout=1)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def test_run(self):
+        self.assertEqual(self.executor.run(pow, 2, 3), 8)
+
+        stats = self.executor.stats()
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['latency']['count'], 1)
+
+    def test_saturated(self):
+        blocked = [threading.Thread(target=self.executor.run, args=(self.release.wait,)) for _ in range(2)]
+        for thread in blocked:
+            thread.start()
+
+        # both admitted, one running and one queued
+        deadline = time.monotonic() + 5
+        while self.executor.in_flight < 2:
+            self.assertLess(time.monotonic(), deadline, 'jobs not admitted')
+            time.sleep(0.001)
+        self.assertEqual(self.executor.queue_depth, 1)
+
+        with self.assertRaises(HashingUnavailable):
+            self.executor.run(pow, 2, 3)
+        self.assertEqual(self.executor.stats()['rejected'], 1)
+
+        self.release.set()
+        for thread in blocked:
+            thread.join()
+        self.assertEqual(self.executor.run(pow, 2, 3), 8)
+
+    def test_timeout(self):
+        executor = HashingExecutor(backend='thread', workers=1, max_queue=0, timeout=0.01)
+        with self.assertRaises(HashingUnavailable):
+            executor.run(self.release.wait)
+
+    def test_token_obtain_503(self):
+        User.objects.create_user(**USER_VASCO)
+
+        with patch('users.hashing.hashing_executor.run', side_effect=HashingUnavailable):
+            response = self.client.post('/jwt/token-obtain', data=json.dumps(USER_VASCO),
+                                        content_type='application/json')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_signup_503(self):
+        # raised by the model manager, answered by the exception handler of the views
+        with patch('users.hashing.hashing_executor.run', side_effect=HashingUnavailable):
+            response = self.client.post('/users', data=json.dumps(USER_VASCO), content_type='application/json')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(User.objects.count(), 0)
+
+    def test_503_code(self):
+        self.assertEqual(ServiceUnavailable().get_codes(), 'service_unavailable')
+        response = exception_handler(HashingUnavailable(), {})
+        self.assertEqual((response.status_code, response.data['detail'].code), (503, 'hashing_unavailable'))
+
 
 class TestUserManager(TestCase):
     def test_create_user_success(self):
@@ -65,6 +382,136 @@ class TestUserManager(TestCase):
         self.assertTrue(user.check_password(USER_VASCO['password']))
 
 
+class TestBulkUsers(TestCase):
+    # 1000000 for the benchmark of `make benchmark-import`
+    BENCHMARK_ROWS = int(os.getenv('USERS_IMPORT_BENCHMARK_ROWS', '20000'))
+
+    def _import(self, text, fmt='csv', **kwargs):
+        rejected = []
+        importer = UserImporter(workers=1, reject=lambda line, message: rejected.append(line), **kwargs)
+        return importer.run(read_rows(io.StringIO(text), fmt)), rejected
+
+    def test_import_csv(self):
+        User.objects.create_user(**USER_JOAO)
+        hashed = hashers.make_password('verystrong3')
+
+        counters, rejected = self._import(
+            'username,email,password,email_confirmed\n'
+            f'{USER_VASCO["username"]},{USER_VASCO["email"]},{USER_VASCO["password"]},true\n'
+            f'chi,chi@FOOTHUB.com,{hashed},\n'
+            f'me,me@foothub.com,{hashed},\n'
+            f'bad name,bad@foothub.com,{hashed},\n'
+            f'nomail,,{hashed},\n'
+            f'{USER_JOAO["username"]},other@foothub.com,{hashed},\n'
+        )
+
+        self.assertEqual(counters, {'read': 6, 'rejected': 3, 'hashed': 1, 'inserted': 2, 'conflicts': 1})
+        self.assertEqual(rejected, [4, 5, 6])
+
+        vasco = User.objects.get(username=USER_VASCO['username'])
+        self.assertTrue(vasco.email_confirmed)
+        self.assertTrue(vasco.check_password(USER_VASCO['password']))
+        self.assertEqual(len(vasco.uuid), 32)
+
+        chi = User.objects.get(username='chi')
+        self.assertEqual(chi.password, hashed)
+        self.assertEqual(chi.email, 'chi@foothub.com')
+        self.assertFalse(chi.email_confirmed)
+
+    def test_import_ndjson(self):
+        unusable = hashers.make_password(None)
+
+        counters, rejected = self._import('\n'.join([
+            json.dumps({'username': 'chi', 'email': 'chi@foothub.com', 'password': unusable, 'uuid': 'a' * 32,
+                        'email_confirmed': True, 'created_at': '2018-01-01T00:00:00+00:00'}),
+            '{"username": ',
+            json.dumps({'username': 'bad', 'email': 'bad@foothub.com', 'password': unusable, 'uuid': 'nope'}),
+        ]), fmt='ndjson')
+
+        self.assertEqual(counters['inserted'], 1)
+        self.assertEqual(rejected, [2, 3])
+
+        chi = User.objects.get(uuid='a' * 32)
+        self.assertEqual(chi.password, unusable)
+        self.assertFalse(chi.has_usable_password())
+        self.assertEqual(chi.created_at.year, 2018)
+
+    def test_export_import_round_trip(self):
+        users = [User.objects.create_user(**USER_VASCO), User.objects.create_user(**USER_JOAO)]
+
+        for fmt in FORMATS:
+            exported = io.StringIO()
+            export_users(exported, fmt)
+            User.objects.all().delete()
+
+            counters, rejected = self._import(exported.getvalue(), fmt=fmt, batch_size=1)
+
+            self.assertEqual((counters['inserted'], counters['hashed'], rejected), (2, 0, []))
+            self.assertEqual(
+                list(User.objects.order_by('id').values_list('uuid', 'username', 'email', 'password')),
+                [(user.uuid, user.username, user.email, user.password) for user in users])
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.ndjson')
+            with open(path, 'w') as stream:
+                stream.write(json.dumps(USER_VASCO) + '\n')
+
+            out = io.StringIO()
+            call_command('import_users', path, workers=1, stdout=out)
+            self.assertIn('1 inserted', out.getvalue())
+
+            path = os.path.join(directory, 'users.csv')
+            call_command('export_users', path)
+            with open(path) as stream:
+                self.assertEqual(next(csv.DictReader(stream))['username'], USER_VASCO['username'])
+
+    @benchmark
+    def test_benchmark(self):
+        hashed = hashers.make_password(USER_VASCO['password'])
+
+        with tempfile.TemporaryFile('w+') as stream:
+            stream.write('username,email,password\n')
+            for i in range(self.BENCHMARK_ROWS):
+                stream.write(f'user{i},user{i}@foothub.com,{hashed}\n')
+            stream.seek(0)
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            counters = UserImporter().run(read_rows(stream, 'csv'))
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        print(f'\nimported {self.BENCHMARK_ROWS} users in {elapsed:.1f}s ({self.BENCHMARK_ROWS / elapsed:.0f} rows/s), '
+              f'peak memory {peak / 2 ** 20:.1f}MiB')
+        self.assertEqual(counters['inserted'], self.BENCHMARK_ROWS)
+        # a batch at a time, whatever the number of rows
+        self.assertLess(peak, 64 * 2 ** 20)
+
+
+class TestMigrateIfNeeded(TestCase):
+    COMMAND = 'users.management.commands.migrate_if_needed'
+
+    def test_up_to_date(self):
+        out = io.StringIO()
+        with patch(f'{self.COMMAND}.call_command') as mock, self.assertNumQueries(1):
+            call_command('migrate_if_needed', stdout=out)
+
+        mock.assert_not_called()
+        self.assertIn('No migrations to apply', out.getvalue())
+
+    def test_pending(self):
+        MigrationRecorder(connection).record_unapplied('users', '0007_user_updated_id_index')
+
+        out = io.StringIO()
+        with patch(f'{self.COMMAND}.call_command') as mock:
+            call_command('migrate_if_needed', stdout=out)
+
+        mock.assert_called_once_with('migrate', database='default', interactive=False, verbosity=1)
+        self.assertIn('Applying 1 migrations', out.getvalue())
+
+
 class TestUserModel(TestCase):
     def test_create_jwt(self):
         user = User.objects.create_user(**USER_VASCO)
@@ -86,6 +533,7 @@ class TestUsersApi(APITestCase):
     CONFIRM_ENDPOINT = 'confirm_email'
     SEND_ENDPOINT = 'send_confirmation_email'
     ME_ENDPOINT = 'me'
+    BATCH_ENDPOINT = 'batch'
     CONTENT_TYPE = 'application/json'
 
     @classmethod
@@ -109,7 +557,12 @@ class TestUsersApi(APITestCase):
     def me_url(cls) -> str:
         return f'{cls.URL}/{cls.ME_ENDPOINT}'
 
+    @classmethod
+    def batch_url(cls) -> str:
+        return f'{cls.URL}/{cls.BATCH_ENDPOINT}'
+
     def setUp(self):
+        super().setUp()
         self.user_vasco = User.objects.create_user(**USER_VASCO)
         self.token = self.user_vasco.create_jwt()
 
@@ -125,9 +578,51 @@ class TestUsersApi(APITestCase):
         response = self.client.options(self.URL, **self.http_auth)
         self.assertEqual(response.status_code, 200)
 
-    def test_list_405(self):
-        response = self.client.get(self.URL, **self.http_auth)
-        self.assertEqual(response.status_code, 405)
+    def test_list_401(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 401)
+
+    def test_list_200(self):
+        users = [self.user_vasco] + [
+            User.objects.create_user(email=f'user{i}@foothub.com', username=f'user{i}', password='verystrong')
+            for i in range(4)
+        ]
+
+        pages, url = [], f'{self.URL}?page_size=2'
+        while url is not None:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, **self.http_auth)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json()['results'])
+            url = response.json()['next']
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([user['uuid'] for page in pages for user in page], [user.uuid for user in users])
+        self.assertEqual(set(pages[0][0]), {'uuid', 'username', 'updated_at'})
+
+        # nothing changed since the last cursor, until a user is saved
+        cursor = response.json()['cursor']
+        response = self.client.get(f'{self.URL}?cursor={cursor}', **self.http_auth)
+        self.assertEqual((response.json()['results'], response.json()['cursor']), ([], cursor))
+
+        users[1].save()
+        response = self.client.get(f'{self.URL}?cursor={cursor}', **self.http_auth)
+        self.assertEqual([user['uuid'] for user in response.json()['results']], [users[1].uuid])
+
+    def test_list_since(self):
+        since = timezone.now()
+        user_joao = User.objects.create_user(**USER_JOAO)
+
+        response = self.client.get(self.URL, {'since': since.isoformat()}, **self.http_auth)
+        self.assertEqual([user['uuid'] for user in response.json()['results']], [user_joao.uuid])
+
+        for invalid in ('yesterday', '2020-13-40T00:00'):
+            response = self.client.get(self.URL, {'since': invalid}, **self.http_auth)
+            self.assertEqual(response.status_code, 400)
+
+    def test_list_404_cursor(self):
+        response = self.client.get(self.URL, {'cursor': 'bm9wZQ=='}, **self.http_auth)
+        self.assertEqual(response.status_code, 404)
 
     def test_update_405(self):
         response = self.client.put(
@@ -158,14 +653,16 @@ class TestUsersApi(APITestCase):
 
     def test_create_user_400_forbidden(self):
         self.assertEqual(User.objects.count(), 1)
-        bad_user = dict(USER_VASCO)
-        bad_user['username'] = 'me'
 
-        response = self.client.post(
-            self.URL, data=json.dumps(bad_user), content_type=self.CONTENT_TYPE)
+        for username in (self.ME_ENDPOINT, self.BATCH_ENDPOINT):
+            bad_user = dict(USER_VASCO)
+            bad_user['username'] = username
 
-        self.assertEqual(response.status_code, 400)
-        self.assertEqual(User.objects.count(), 1)
+            response = self.client.post(
+                self.URL, data=json.dumps(bad_user), content_type=self.CONTENT_TYPE)
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(User.objects.count(), 1)
 
     def test_create_user_400_existing(self):
         self.assertEqual(User.objects.count(), 1)
@@ -192,6 +689,15 @@ class TestUsersApi(APITestCase):
         self.assertEqual(user_joao.email, USER_JOAO['email'])
         self.assertTrue(user_joao.check_password(USER_JOAO['password']))
 
+    def test_create_user_outbox(self):
+        response = self.client.post(
+            self.URL, data=json.dumps(USER_JOAO), content_type=self.CONTENT_TYPE)
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(
+            list(OutboxEvent.objects.values_list('task', flat=True)),
+            [broadcast_registration.name, send_confirmation_emails.name])
+
     def test_retrieve_401(self):
         response = self.client.get(
             self.instance_url(USER_VASCO['username']))
@@ -232,6 +738,10 @@ class TestUsersApi(APITestCase):
 
         self.assertEqual(User.objects.count(), 0)
 
+        # the deleted user's tokens are revoked
+        response = self.client.get(self.me_url(), **self.http_auth)
+        self.assertEqual(response.status_code, 401)
+
     @patch('users.views.broadcast_registration')
     def test_broadcast_registration_401(self, mock):
         response = self.client.get(self.broadcast_registration_url())
@@ -244,13 +754,13 @@ class TestUsersApi(APITestCase):
         self.assertEqual(response.status_code, 204)
         mock.assert_called_once_with(uuid=self.user_vasco.uuid, username=self.user_vasco.username)
 
-    @patch('users.views.send_confirmation_email')
+    @patch('users.views.request_confirmation_email')
     def test_send_confirmation_email_204_user_not_found(self, mock):
         response = self.client.get(self.send_email_url('unknown'))
         self.assertEqual(response.status_code, 204)
         mock.assert_not_called()
 
-    @patch('users.views.send_confirmation_email')
+    @patch('users.views.request_confirmation_email')
     def test_send_confirmation_email_204_already_confirmed_username(self, mock):
         self.user_vasco.email_confirmed = True
         self.user_vasco.save()
@@ -258,12 +768,21 @@ class TestUsersApi(APITestCase):
         self.assertEqual(response.status_code, 204)
         mock.assert_not_called()
 
-    @patch('users.views.send_confirmation_email')
+    @patch('users.views.request_confirmation_email')
     def test_send_confirmation_email_204(self, mock):
         self.assertFalse(self.user_vasco.email_confirmed)
         response = self.client.get(self.send_email_url(self.user_vasco.username))
         self.assertEqual(response.status_code, 204)
-        mock.assert_called_once_with(user=ConfirmEmailSerializer(self.user_vasco).data)
+        mock.assert_called_once_with(self.user_vasco)
+
+    @patch('users.models.User.create_jwt')
+    def test_send_confirmation_email_204_enqueues_uuid(self, mock_sign):
+        response = self.client.get(self.send_email_url(self.user_vasco.username))
+        self.assertEqual(response.status_code, 204)
+        mock_sign.assert_not_called()
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.task, event.kwargs), (send_confirmation_emails.name, {'uuids': [self.user_vasco.uuid]}))
 
     def test_confirm_400_no_token(self):
         self.assertFalse(User.objects.get(username=USER_VASCO['username']).email_confirmed)
@@ -285,6 +804,15 @@ class TestUsersApi(APITestCase):
         self.assertEqual(response.json()['non_field_errors'], ["Error decoding signature."])
         self.assertFalse(User.objects.get(username=USER_VASCO['username']).email_confirmed)
 
+    def test_confirm_400_revoked_token(self):
+        self.revocations.revoke_user(self.user_vasco.uuid)
+
+        response = self.client.post(
+            self.confirm_email_url(self.token), data=json.dumps({}), content_type=self.CONTENT_TYPE)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['non_field_errors'], ['Token has been revoked.'])
+        self.assertFalse(User.objects.get(username=USER_VASCO['username']).email_confirmed)
+
     def test_confirm_204(self):
         self.assertFalse(User.objects.get(username=USER_VASCO['username']).email_confirmed)
 
@@ -304,54 +832,476 @@ class TestUsersApi(APITestCase):
         response_id = self.client.get(self.instance_url(username=USER_VASCO['username']), **self.http_auth)
         self.assertEqual(response_me.json(), response_id.json())
 
+    def test_me_etag(self):
+        response = self.client.get(self.me_url(), **self.http_auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith(f'"{self.user_vasco.uuid}-'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('Authorization', response['Vary'])
+
+        response_id = self.client.get(self.instance_url(username=USER_VASCO['username']), **self.http_auth)
+        self.assertEqual(response_id['ETag'], response['ETag'])
+
+    def test_me_304(self):
+        etag = self.client.get(self.me_url(), **self.http_auth)['ETag']
+
+        with patch.object(UserSerializer, 'to_representation') as to_representation, self.assertNumQueries(0):
+            response = self.client.get(self.me_url(), HTTP_IF_NONE_MATCH=etag, **self.http_auth)
+        to_representation.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_me_304_if_modified_since(self):
+        last_modified = self.client.get(self.me_url(), **self.http_auth)['Last-Modified']
+
+        response = self.client.get(self.me_url(), HTTP_IF_MODIFIED_SINCE=last_modified, **self.http_auth)
+        self.assertEqual(response.status_code, 304)
+
+    def test_me_etag_changes_on_save(self):
+        etag = self.client.get(self.me_url(), **self.http_auth)['ETag']
+
+        self.user_vasco.email_confirmed = True
+        self.user_vasco.save()
+
+        response = self.client.get(self.me_url(), HTTP_IF_NONE_MATCH=etag, **self.http_auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['username'], USER_VASCO['username'])
+
+    def test_retrieve_304(self):
+        url = self.instance_url(username=USER_VASCO['username'])
+        etag = self.client.get(url, **self.http_auth)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.http_auth)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"other"', **self.http_auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_batch_401(self):
+        response = self.client.post(self.batch_url(), data=json.dumps({'usernames': ['chi']}),
+                                    content_type=self.CONTENT_TYPE)
+        self.assertEqual(response.status_code, 401)
+
+    def test_batch_200(self):
+        user_joao = User.objects.create_user(**USER_JOAO)
+        data = {'uuids': [self.user_vasco.uuid, 'f' * 32], 'usernames': [USER_JOAO['username'], 'unknown']}
+
+        with self.assertNumQueries(1):
+            response = self.client.post(self.batch_url(), data=json.dumps(data), content_type=self.CONTENT_TYPE,
+                                        **self.http_auth)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'results': [
+            {'uuid': user_joao.uuid, 'username': USER_JOAO['username']},
+            {'uuid': self.user_vasco.uuid, 'username': USER_VASCO['username']},
+        ]})
+
+        response_get = self.client.get(
+            f'{self.batch_url()}?uuids={",".join(data["uuids"])}&usernames={",".join(data["usernames"])}',
+            **self.http_auth)
+        self.assertEqual(response_get.json(), response.json())
+        self.assertEqual(response_get['ETag'], response['ETag'])
+
+    def test_batch_304(self):
+        url = f'{self.batch_url()}?usernames={USER_VASCO["username"]}'
+        etag = self.client.get(url, **self.http_auth)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.http_auth)
+        self.assertEqual(response.status_code, 304)
+
+        self.user_vasco.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.http_auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_batch_400(self):
+        response = self.client.get(self.batch_url(), **self.http_auth)
+        self.assertEqual(response.status_code, 400)
+
+        with override_settings(USER_BATCH_MAX_SIZE=2):
+            response = self.client.get(f'{self.batch_url()}?usernames=a,b,c', **self.http_auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_any_lookup(self):
+        queryset = User.objects.filter(uuid__any=[self.user_vasco.uuid, 'f' * 32])
+        self.assertIn('= ANY(', str(queryset.query))
+        self.assertEqual(list(queryset), [self.user_vasco])
+        self.assertFalse(User.objects.filter(uuid__any=[]).exists())
+
+
+class TestUserCache(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user_vasco = User.objects.create_user(**USER_VASCO)
+        self.cache = UserCache(local_max_entries=100, local_ttl=60, ttl=300, negative_ttl=30, lock_timeout=1,
+                               retry_after=5, client=lambda: self.redis)
+
+    def test_read_through(self):
+        with self.assertNumQueries(1):
+            user = self.cache.get_by_username(USER_VASCO['username'])
+        self.assertEqual((user.pk, user.uuid, user.email),
+                         (self.user_vasco.pk, self.user_vasco.uuid, USER_VASCO['email']))
+        self.assertEqual(user.created_at, self.user_vasco.created_at)
+        self.assertEqual(user.get_deferred_fields(), {'password', 'last_login'})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cache.get_by_username(USER_VASCO['username']), user)
+            self.cache.local.clear()
+            # cached under the uuid as well
+            self.assertEqual(self.cache.get_by_uuid(self.user_vasco.uuid), user)
+
+        self.assertEqual(self.cache.stats(), {
+            'local_hits': 1, 'redis_hits': 1, 'loads': 1, 'coalesced': 0, 'hit_ratio': 2 / 3})
+
+    def test_password_not_cached(self):
+        self.cache.get_by_username(USER_VASCO['username'])
+        key = UserCache.key('username', USER_VASCO['username'])
+        self.assertNotIn(b'password', self.redis.get(key))
+
+    def test_unknown_cached(self):
+        self.assertIsNone(self.cache.get_by_username(USER_JOAO['username']))
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.cache.get_by_username(USER_JOAO['username']))
+
+        self.assertLessEqual(self.redis.ttl(UserCache.key('username', USER_JOAO['username'])), 30)
+
+    def test_invalidated(self):
+        for cache in (self.cache, user_cache):
+            cache.get_by_username(USER_VASCO['username'])
+            cache.get_by_username(USER_JOAO['username'])
+
+        self.user_vasco.email_confirmed = True
+        self.user_vasco.save()
+        user_joao = User.objects.create_user(**USER_JOAO)
+
+        # the signals invalidate redis, and the local entries of the process' cache
+        self.assertTrue(user_cache.get_by_username(USER_VASCO['username']).email_confirmed)
+        self.assertEqual(user_cache.get_by_uuid(user_joao.uuid), user_joao)
+
+        self.user_vasco.delete()
+        self.assertIsNone(user_cache.get_by_uuid(self.user_vasco.uuid))
+
+    def test_stale_load_not_stored(self):
+        key = UserCache.key('username', USER_VASCO['username'])
+        # queried by a concurrent read before the user is saved, stored after its invalidation
+        stale = self.cache._query('username', USER_VASCO['username'])
+        self.user_vasco.email_confirmed = True
+        self.user_vasco.save()
+
+        self.cache._store(self.redis, stale, key)
+        self.assertIsNone(self.redis.get(key))
+        self.cache._store(self.redis, None, key)
+        self.assertIsNone(self.redis.get(key))
+
+        # the row as saved is
+        self.assertTrue(self.cache.get_by_username(USER_VASCO['username']).email_confirmed)
+        self.assertIsNotNone(self.redis.get(key))
+
+        # and, once deleted, the row as it last was is not either
+        stale = self.cache._query('username', USER_VASCO['username'])
+        self.user_vasco.delete()
+        self.cache._store(self.redis, stale, key)
+        self.assertIsNone(self.redis.get(key))
+
+    def test_single_flight(self):
+        record = User.objects.filter(pk=self.user_vasco.pk).values(*CACHED_FIELDS).get()
+
+        def slow_query(field, value):
+            time.sleep(0.1)
+            return record
+
+        with patch.object(self.cache, '_query', side_effect=slow_query) as mock:
+            threads = [threading.Thread(target=self.cache.get_by_username, args=(USER_VASCO['username'],))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        mock.assert_called_once()
+        self.assertEqual(self.cache.stats()['coalesced'], 7)
+
+    def test_waits_for_other_process(self):
+        key = UserCache.key('username', USER_VASCO['username'])
+        user_cache.get_by_username(USER_VASCO['username'])
+        cached = self.redis.get(key)
+        self.redis.delete(key)
+
+        # another process holds the lock, and stores the record shortly after
+        self.redis.set(f'{key}:lock', 'other', px=1000)
+        timer = threading.Timer(0.05, self.redis.set, args=(key, cached))
+        timer.start()
+
+        with self.assertNumQueries(0):
+            user = self.cache.get_by_username(USER_VASCO['username'])
+        timer.join()
+
+        self.assertEqual(user, self.user_vasco)
+        self.assertEqual(self.cache.stats()['coalesced'], 1)
+
+    def test_redis_unavailable(self):
+        with patch.object(self.redis, 'get', side_effect=redis.ConnectionError) as mock:
+            for _ in range(3):
+                self.assertEqual(self.cache.get_by_username(USER_VASCO['username']), self.user_vasco)
+        mock.assert_called_once()
+        self.assertEqual(self.cache.stats()['loads'], 3)
+
+    def test_retrieve(self):
+        http_auth = {'HTTP_AUTHORIZATION': f'JWT {self.user_vasco.create_jwt()}'}
+        self.client.get(f'/users/{USER_VASCO["username"]}', **http_auth)
+        self.client.get('/users/unknown', **http_auth)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/users/{USER_VASCO["username"]}', **http_auth)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.get('/users/unknown', **http_auth).status_code, 404)
+
+
+class TestRateLimiting(APITestCase):
+    ROUNDS = 2000
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('30/min'), (30, 0.5))
+        self.assertEqual(parse_rate('3/hour'), (3, 3 / 3600))
+        self.assertEqual(parse_rate('10/s'), (10, 10))
+
+    def _limiters(self):
+        return {'redis': self.limiter, 'local': LocalBuckets(1000)}
+
+    def _acquire(self, name, limiter, buckets, now):
+        if name == 'redis':
+            with patch('users.throttling.time.time', return_value=now):
+                return limiter.acquire(buckets)
+        return limiter.acquire(buckets, now)
+
+    def test_token_bucket(self):
+        for name, limiter in self._limiters().items():
+            with self.subTest(limiter=name):
+                bucket = (f'{name}:ip', 3, 0.5)
+                self.assertEqual([self._acquire(name, limiter, [bucket], 100) for _ in range(3)], [0, 0, 0])
+                self.assertAlmostEqual(self._acquire(name, limiter, [bucket], 100), 2)
+
+                # refills at the rate, never above the capacity
+                self.assertEqual(self._acquire(name, limiter, [bucket], 102), 0)
+                self.assertGreater(self._acquire(name, limiter, [bucket], 102), 0)
+                self.assertEqual([self._acquire(name, limiter, [bucket], 1000) for _ in range(3)], [0, 0, 0])
+                self.assertGreater(self._acquire(name, limiter, [bucket], 1000), 0)
+
+    def test_all_or_nothing(self):
+        for name, limiter in self._limiters().items():
+            with self.subTest(limiter=name):
+                ip, username = (f'{name}:ip', 2, 1), (f'{name}:username', 1, 0.1)
+                self.assertEqual(self._acquire(name, limiter, [ip, username], 100), 0)
+                self.assertAlmostEqual(self._acquire(name, limiter, [ip, username], 100), 10)
+                # the ip bucket was left untouched by the refused request
+                self.assertEqual(self._acquire(name, limiter, [ip], 100), 0)
+
+    def test_redis_unavailable(self):
+        with patch.object(self.redis, 'eval', side_effect=redis.ConnectionError) as mock:
+            for _ in range(2):
+                self.assertEqual(self.limiter.acquire([('ip', 2, 1)]), 0)
+            self.assertGreater(self.limiter.acquire([('ip', 2, 1)]), 0)
+
+        # fell back to the local buckets, without trying redis again
+        mock.assert_called_once()
+
+    def test_local_max_keys(self):
+        buckets = LocalBuckets(max_keys=2)
+        for key in ('a', 'b', 'c'):
+            buckets.acquire([(key, 1, 0.001)], 100)
+        self.assertEqual(buckets.acquire([('a', 1, 0.001)], 100), 0)
+        self.assertGreater(buckets.acquire([('c', 1, 0.001)], 100), 0)
+
+    @patch('users.views.request_confirmation_email')
+    def test_send_confirmation_email_429(self, mock):
+        url = f'/users/{USER_VASCO["username"]}/send_confirmation_email'
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).status_code, 204)
+
+        response = self.client.get(url.replace(USER_VASCO['username'], USER_VASCO['username'].upper()))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(mock.call_count, 0)
+
+        self.assertEqual(self.client.get('/users/other/send_confirmation_email').status_code, 204)
+
+    def test_signup_429(self):
+        for i in range(5):
+            user = {'username': f'user{i}', 'email': 'taken@foothub.com', 'password': 'legitpw123'}
+            self.client.post('/users', data=json.dumps(user), content_type='application/json')
+
+        user = {'username': 'user5', 'email': 'TAKEN@foothub.com', 'password': 'legitpw123'}
+        response = self.client.post('/users', data=json.dumps(user), content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+
+    def test_login_429(self):
+        User.objects.create_user(**USER_VASCO)
+        credentials = {'username': USER_VASCO['username'], 'password': 'wrong'}
+
+        for _ in range(10):
+            response = self.client.post('/jwt/token-obtain', data=json.dumps(credentials),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/jwt/token-obtain', data=json.dumps(USER_VASCO), content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+
+    @benchmark
+    def test_benchmark(self):
+        buckets = [('ip:127.0.0.1', 10 ** 9, 10 ** 9), ('username:vasmv', 10 ** 9, 10 ** 9)]
+        local = RateLimiter(max_local_keys=1000, retry_after=3600, client=lambda: self.redis)
+        local._redis_down_until = float('inf')
+
+        overhead = {}
+        for name, limiter in (('redis', self.limiter), ('local', local)):
+            started = time.perf_counter()
+            for _ in range(self.ROUNDS):
+                self.assertEqual(limiter.acquire(buckets), 0)
+            overhead[name] = (time.perf_counter() - started) / self.ROUNDS
+
+        print(f'\nrate limiting overhead per request: {overhead["redis"] * 1e6:.0f}us fakeredis (lua), '
+              f'{overhead["local"] * 1e6:.0f}us in process')
+
 
 class TestUsersTasks(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user_vasco = User.objects.create_user(**USER_VASCO)
 
+    @patch('users.models.User.create_jwt')
     @patch('users.tasks.send_confirmation_email.delay')
     @patch('users.tasks.broadcast_registration.delay')
-    def test_on_create(self, mock_broadcast, mock_confirmation):
+    def test_on_create(self, mock_broadcast, mock_confirmation, mock_sign):
         on_create(self.user_vasco)
-        mock_broadcast.assert_called_once_with(uuid=self.user_vasco.uuid, username=self.user_vasco.username)
-        mock_confirmation.assert_called_once_with(user=ConfirmEmailSerializer(self.user_vasco).data)
-
-    def test_broadcast_registration(self):
-        with patch('users.tasks.post') as mock:
+        mock_broadcast.assert_not_called()
+        mock_confirmation.assert_not_called()
+        mock_sign.assert_not_called()
 
-            expected_subscribers = [
-                'http://core:8000/profiles'
-            ]
+        broadcast_event, confirmation_event = OutboxEvent.objects.all()
 
-            def side_effect(url, json):
-                self.assertIn(url, expected_subscribers)
-                self.assertIn('token', json)
-                payload = api_settings.JWT_DECODE_HANDLER(json['token'])
-                self.assertEqual(payload['uuid'], self.user_vasco.uuid)
-                self.assertEqual(payload['username'], self.user_vasco.username)
-                return mock
+        self.assertEqual(broadcast_event.task, broadcast_registration.name)
+        self.assertEqual(broadcast_event.kwargs, {'uuid': self.user_vasco.uuid, 'username': self.user_vasco.username})
 
-            mock.side_effect = side_effect
+        self.assertEqual(confirmation_event.task, send_confirmation_emails.name)
+        self.assertEqual(confirmation_event.kwargs, {'uuids': [self.user_vasco.uuid]})
 
-            mock.status_code = 201
-            self.assertTrue(broadcast_registration(self.user_vasco.uuid, self.user_vasco.username))
-            self.assertEqual(mock.call_count, len(expected_subscribers))
+    def test_request_confirmation_email(self):
+        request_confirmation_email(self.user_vasco)
 
-            mock.reset_mock()
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.task, event.kwargs), (send_confirmation_emails.name, {'uuids': [self.user_vasco.uuid]}))
 
-            mock.status_code = 404
-            self.assertFalse(broadcast_registration(self.user_vasco.uuid, self.user_vasco.username))
-            self.assertEqual(mock.call_count, len(expected_subscribers))
+    @patch('users.tasks.current_app.producer_or_acquire')
+    @patch('users.tasks.current_app.send_task')
+    def test_relay_outbox(self, mock_send, mock_producer):
+        user_joao = User.objects.create_user(**USER_JOAO)
+        on_create(self.user_vasco)
+        on_create(user_joao)
+        broadcast_keys = list(
+            OutboxEvent.objects.filter(task=broadcast_registration.name).values_list('idempotency_key', flat=True))
+
+        self.assertEqual(relay_outbox(), 4)
+
+        self.assertEqual(OutboxEvent.objects.count(), 0)
+        mock_producer.assert_called_once()
+
+        # broadcasts are published one by one, confirmation emails are merged into a single batch
+        calls = [(call[0][0], call[1]['kwargs'], call[1]['task_id']) for call in mock_send.call_args_list]
+        self.assertEqual(len(calls), 3)
+        self.assertEqual([(task, task_id) for task, _, task_id in calls[:2]],
+                         [(broadcast_registration.name, key) for key in broadcast_keys])
+        self.assertEqual(calls[0][1]['outbox_keys'], [broadcast_keys[0]])
+        self.assertEqual(calls[2][0], send_confirmation_emails.name)
+        self.assertEqual(calls[2][1]['uuids'], [self.user_vasco.uuid, user_joao.uuid])
+        self.assertEqual(len(calls[2][1]['outbox_keys']), 2)
+
+        mock_producer.reset_mock()
+        self.assertEqual(relay_outbox(), 0)
+        mock_producer.assert_not_called()
+
+    @patch('users.tasks.current_app.producer_or_acquire')
+    @patch('users.tasks.current_app.send_task')
+    def test_relay_outbox_batches(self, mock_send, mock_producer):
+        for i in range(5):
+            on_create(User.objects.create_user(username=f'user{i}', email=f'user{i}@foothub.com', password='pw'))
+
+        with patch.dict(settings.OUTBOX, BATCH_SIZE=4), patch.object(send_confirmation_emails, 'outbox_batch_size', 1):
+            self.assertEqual(relay_outbox(), 10)
+
+        self.assertEqual(mock_producer.call_count, 3)
+        self.assertEqual(mock_send.call_count, 10)
+
+    def test_purge_refresh_tokens(self):
+        now = timezone.now()
+        RefreshToken.objects.bulk_create([
+            RefreshToken(user=self.user_vasco, token_hash=f'{i:064}', expires_at=now + timedelta(days=1 - i % 2 * 2),
+                         revoked=i % 3 == 0)
+            for i in range(10)
+        ])
+
+        with patch.dict(settings.REFRESH_TOKEN, PURGE_BATCH_SIZE=2):
+            self.assertEqual(purge_refresh_tokens(), 5)
+
+        # revoked tokens are kept until they expire
+        self.assertEqual(RefreshToken.objects.count(), 5)
+        self.assertFalse(RefreshToken.objects.filter(expires_at__lte=now).exists())
+        self.assertEqual(RefreshToken.objects.filter(revoked=True).count(), 2)
+
+    @patch('users.tasks.notify_subscriber.apply_async')
+    def test_broadcast_registration(self, mock_retry):
+        with StubSubscriber() as core, StubSubscriber() as other:
+            with override_settings(REGISTRATION_SUBSCRIBERS=[core.url, other.url]):
+                self.assertTrue(broadcast_registration(self.user_vasco.uuid, self.user_vasco.username))
+                mock_retry.assert_not_called()
+
+                for subscriber in (core, other):
+                    self.assertEqual(len(subscriber.received), 1)
+                    payload = api_settings.JWT_DECODE_HANDLER(subscriber.received[0]['token'])
+                    self.assertEqual(payload['uuid'], self.user_vasco.uuid)
+                    self.assertEqual(payload['username'], self.user_vasco.username)
+
+                other.status_code = 404
+                self.assertFalse(broadcast_registration(self.user_vasco.uuid, self.user_vasco.username))
+                mock_retry.assert_called_once()
+                self.assertEqual(mock_retry.call_args[1]['args'][0], other.url)
+
+            # both broadcasts went through the same keep-alive connection
+            self.assertEqual(len(core.connections), 1)
+
+    @patch('users.tasks.notify_subscriber.apply_async')
+    def test_broadcast_registration_slow_subscriber(self, mock_retry):
+        with StubSubscriber() as core, StubSubscriber(delay=1) as slow:
+            with override_settings(REGISTRATION_SUBSCRIBERS=[core.url, slow.url]):
+                with patch.dict(settings.REGISTRATION_BROADCAST, TIMEOUT=0.2):
+                    self.assertFalse(broadcast_registration(self.user_vasco.uuid, self.user_vasco.username))
+
+        self.assertEqual(len(core.received), 1)
+        mock_retry.assert_called_once()
+        self.assertEqual(mock_retry.call_args[1]['args'][0], slow.url)
+
+        metrics = subscribers.metrics.snapshot()
+        self.assertEqual(metrics[core.url]['deliveries'], 1)
+        self.assertEqual(metrics[slow.url]['failures'], 1)
+        self.assertLess(metrics[slow.url]['latency_max'], 1)
+
+    def test_notify_subscriber(self):
+        with StubSubscriber() as core:
+            self.assertTrue(notify_subscriber.apply(args=(core.url, 'jwt.mocked')).get())
+            self.assertEqual(core.received, [{'token': 'jwt.mocked'}])
+
+            core.status_code = 500
+            with patch('users.tasks.notify_subscriber.retry', side_effect=Retry) as mock_retry:
+                with self.assertRaises(Retry):
+                    notify_subscriber.apply(args=(core.url, 'jwt.mocked'), throw=True)
+                self.assertGreaterEqual(mock_retry.call_args[1]['countdown'], 0)
 
     @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
     def test_send_confirmation_email(self):
-        user_dict = {
-            'email': self.user_vasco.email,
-            'token': 'jwt.mocked'
-        }
-
-        send_confirmation_email(user=user_dict)
+        self.assertTrue(send_confirmation_email(uuid=self.user_vasco.uuid))
 
         self.assertEqual(len(mail.outbox), 1)
         sent_mail = mail.outbox[0]
@@ -359,5 +1309,127 @@ class TestUsersTasks(TestCase):
         self.assertEqual(sent_mail.from_email, 'FootHub Team <no-reply@foothub.com>')
         self.assertEqual(sent_mail.subject, "FootHub Registration")
         self.assertIn("Use the link to confirm email: ", sent_mail.body)
-        self.assertIn(f'{settings.FRONTEND_URL}/confirm-registration?token={user_dict["token"]}', sent_mail.body)
-        self.assertEqual(sent_mail.to, [user_dict['email']])
+        self.assertIn(f'{settings.FRONTEND_URL}/confirm-registration?token=', sent_mail.body)
+        self.assertEqual(sent_mail.to, [self.user_vasco.email])
+
+        token = sent_mail.body.split('?token=')[1]
+        self.assertEqual(api_settings.JWT_DECODE_HANDLER(token)['uuid'], self.user_vasco.uuid)
+
+        html_body, mimetype = sent_mail.alternatives[0]
+        self.assertEqual(mimetype, 'text/html')
+        self.assertIn(f'href="{settings.FRONTEND_URL}/confirm-registration?token={token}"', html_body)
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_send_confirmation_email_already_confirmed(self):
+        User.objects.filter(uuid=self.user_vasco.uuid).update(email_confirmed=True)
+
+        self.assertFalse(send_confirmation_email(uuid=self.user_vasco.uuid))
+        self.assertFalse(send_confirmation_email(uuid='unknown'))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_confirmation_templates_compiled_once(self):
+        self.assertIs(emails.confirmation_templates(), emails.confirmation_templates())
+
+    def _confirmation_users(self, count):
+        users = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@foothub.com', password='!') for i in range(count))
+        return [user.uuid for user in users]
+
+    def test_send_confirmation_emails(self):
+        uuids = self._confirmation_users(3)
+
+        with StubSMTPServer() as smtp, override_settings(**smtp.settings):
+            outcomes = send_confirmation_emails(uuids=uuids)
+
+        self.assertEqual(outcomes, {uuid: True for uuid in uuids})
+        self.assertEqual(smtp.connections, 1)
+        self.assertEqual(len(smtp.messages), 3)
+        self.assertIn(b'confirm-registration?token=', smtp.messages[0])
+
+    @patch('users.tasks.send_confirmation_email.apply_async')
+    def test_send_confirmation_emails_retries_failed_messages(self, mock_retry):
+        uuids = self._confirmation_users(3)
+
+        with StubSMTPServer(refused=['user1@foothub.com']) as smtp, override_settings(**smtp.settings):
+            outcomes = send_confirmation_emails(uuids=uuids)
+
+        self.assertEqual(outcomes, {uuids[0]: True, uuids[1]: False, uuids[2]: True})
+        self.assertEqual(len(smtp.messages), 2)
+        mock_retry.assert_called_once()
+        self.assertEqual(mock_retry.call_args[1]['kwargs'], {'uuid': uuids[1]})
+
+    def test_outbox_task_runs_once_per_event(self):
+        uuids = self._confirmation_users(3)
+        client = fakeredis.FakeStrictRedis()
+        client.flushall()
+
+        with patch('users.tasks.get_redis', lambda: client), StubSMTPServer() as smtp, \
+                override_settings(**smtp.settings):
+            first = send_confirmation_emails(uuids=uuids[:2], outbox_keys=['a', 'b'])
+            # event 'b' relayed again, in a batch with a new event
+            second = send_confirmation_emails(uuids=uuids[1:], outbox_keys=['b', 'c'])
+            self.assertIsNone(send_confirmation_emails(uuids=uuids[2:], outbox_keys=['c']))
+
+        self.assertEqual((list(first), list(second)), (uuids[:2], uuids[2:]))
+        self.assertEqual(len(smtp.messages), 3)
+        self.assertEqual(client.get('outbox:a'), b'done')
+
+    def test_outbox_task_failure_releases_keys(self):
+        client = fakeredis.FakeStrictRedis()
+        client.flushall()
+        args = (self.user_vasco.uuid, self.user_vasco.username)
+
+        with patch('users.tasks.get_redis', lambda: client), \
+                patch('users.subscribers.broadcast', side_effect=[OSError, {}]) as mock_broadcast:
+            with self.assertRaises(OSError):
+                broadcast_registration(*args, outbox_keys=['a'])
+            self.assertTrue(broadcast_registration(*args, outbox_keys=['a']))
+            self.assertIsNone(broadcast_registration(*args, outbox_keys=['a']))
+
+        self.assertEqual(mock_broadcast.call_count, 2)
+
+    def test_outbox_task_redis_down(self):
+        client = redis.StrictRedis(host='127.0.0.1', port=1)
+
+        with patch('users.tasks.get_redis', lambda: client), \
+                patch('users.subscribers.broadcast', return_value={}) as mock_broadcast:
+            for _ in range(2):
+                self.assertTrue(broadcast_registration(self.user_vasco.uuid, self.user_vasco.username,
+                                                       outbox_keys=['a']))
+
+        # at least once
+        self.assertEqual(mock_broadcast.call_count, 2)
+
+    def test_send_confirmation_emails_server_down(self):
+        uuids = self._confirmation_users(2)
+
+        with StubSMTPServer() as smtp:
+            unreachable = smtp.settings
+
+        with override_settings(**unreachable), patch('users.tasks.send_confirmation_emails.retry',
+                                                     side_effect=Retry) as mock_retry:
+            with self.assertRaises(Retry):
+                send_confirmation_emails.apply(kwargs={'uuids': uuids}, throw=True)
+            mock_retry.assert_called_once()
+
+    @benchmark
+    def test_benchmark_confirmation_emails(self):
+        uuids = self._confirmation_users(50)
+
+        with StubSMTPServer() as smtp, override_settings(**smtp.settings):
+            started = time.perf_counter()
+            for uuid in uuids:
+                send_confirmation_email(uuid=uuid)
+            single_elapsed = time.perf_counter() - started
+            single_connections = smtp.connections
+
+            smtp.connections = 0
+            started = time.perf_counter()
+            send_confirmation_emails(uuids=uuids)
+            batch_elapsed = time.perf_counter() - started
+
+        print(f'\n{len(uuids)} confirmation emails: {len(uuids) / single_elapsed:.0f} msg/s one per session, '
+              f'{len(uuids) / batch_elapsed:.0f} msg/s batched')
+        self.assertEqual(single_connections, len(uuids))
+        self.assertEqual(smtp.connections, 1)
+        self.assertEqual(len(smtp.messages), 2 * len(uuids))
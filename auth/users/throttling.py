@@ -0,0 +1,161 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+import redis
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from auth.redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+# (key, capacity, refill rate in tokens per second)
+Bucket = Tuple[str, int, float]
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Takes one token from every bucket in KEYS, or from none of them when one is empty, returning the seconds to wait
+# (0 when allowed). ARGV holds the current time, then a capacity and a refill rate per key.
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local levels, wait = {}, 0
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+    levels[i] = math.min(capacity, (tonumber(bucket[1]) or capacity) + elapsed * rate)
+    if levels[i] < 1 then wait = math.max(wait, (1 - levels[i]) / rate) end
+end
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    if wait == 0 then levels[i] = levels[i] - 1 end
+    redis.call('HSET', key, 'tokens', levels[i])
+    redis.call('HSET', key, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+end
+return tostring(wait)
+"""
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """
+    `requests/period`, period being one of s, m(in), h(our), d(ay), as a bucket capacity and refill rate.
+    """
+    requests, period = rate.split('/')
+    capacity = int(requests)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+class LocalBuckets:
+    """
+    In process token buckets with the semantics of `ACQUIRE_SCRIPT`, holding at most `max_keys` buckets.
+    """
+
+    def __init__(self, max_keys: int) -> None:
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: OrderedDict = OrderedDict()
+
+    def acquire(self, buckets: List[Bucket], now: float) -> float:
+        with self._lock:
+            levels, wait = [], 0.0
+            for key, capacity, rate in buckets:
+                tokens, ts = self._buckets.get(key, (capacity, now))
+                levels.append(min(capacity, tokens + max(0.0, now - ts) * rate))
+                if levels[-1] < 1:
+                    wait = max(wait, (1 - levels[-1]) / rate)
+
+            for (key, _, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - 1 if wait == 0 else tokens, now)
+                self._buckets.move_to_end(key)
+
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+            return wait
+
+
+class RateLimiter:
+    """
+    Token buckets shared by every process through redis, falling back to `LocalBuckets` for `retry_after` seconds
+    whenever redis cannot be reached.
+    """
+
+    def __init__(self, max_local_keys: int, retry_after: int,
+                 client: Callable[[], redis.StrictRedis] = get_redis) -> None:
+        self.retry_after = retry_after
+        self.local = LocalBuckets(max_local_keys)
+        self._client = client
+        self._redis_down_until: Optional[float] = None
+
+    def acquire(self, buckets: List[Bucket]) -> float:
+        """
+        Takes a token from each bucket, returning 0 or, when any of them is empty, the seconds to wait instead.
+        """
+        now = time.time()
+
+        if self._redis_down_until is None or time.monotonic() >= self._redis_down_until:
+            try:
+                return self._acquire_redis(buckets, now)
+            except redis.RedisError as exc:
+                logger.warning('Rate limiting in process, redis is unavailable: %s', exc)
+                self._redis_down_until = time.monotonic() + self.retry_after
+
+        return self.local.acquire(buckets, now)
+
+    def _acquire_redis(self, buckets: List[Bucket], now: float) -> float:
+        args: List[float] = [now]
+        for _, capacity, rate in buckets:
+            args += [capacity, rate]
+
+        # EVAL rather than EVALSHA: redis keeps the short script compiled, and fakeredis only implements EVAL
+        wait = float(self._client().eval(ACQUIRE_SCRIPT, len(buckets), *[key for key, _, _ in buckets], *args))
+        self._redis_down_until = None
+        return wait
+
+
+limiter = RateLimiter(
+    max_local_keys=settings.RATE_LIMIT_FALLBACK['MAX_KEYS'],
+    retry_after=settings.RATE_LIMIT_FALLBACK['RETRY_AFTER'],
+)
+
+
+class RateThrottle(BaseThrottle):
+    """
+    Throttles the view's `throttle_scope` with the buckets of `settings.RATE_LIMITS[throttle_scope]`, one per
+    client identifier (ip, username, email) found in the request; a request takes a token from all of them.
+    """
+
+    def __init__(self) -> None:
+        self.wait_time = 0.0
+
+    def identify(self, identifier: str, request, view) -> Optional[str]:
+        if identifier == 'ip':
+            return self.get_ident(request)
+
+        data = request.data if hasattr(request.data, 'get') else {}
+        value = data.get(identifier) or view.kwargs.get(identifier)
+        # usernames and emails are matched case insensitively, see users.backends
+        return value.strip().lower()[:254] if isinstance(value, str) and value.strip() else None
+
+    def allow_request(self, request, view) -> bool:
+        scope = getattr(view, 'throttle_scope', None)
+        buckets = []
+
+        for identifier, rate in settings.RATE_LIMITS.get(scope, {}).items():
+            value = self.identify(identifier, request, view)
+            if value is not None:
+                buckets.append((f'throttle:{scope}:{identifier}:{value}', *parse_rate(rate)))
+
+        if not buckets:
+            return True
+
+        self.wait_time = limiter.acquire(buckets)
+        return self.wait_time == 0
+
+    def wait(self) -> float:
+        return self.wait_time
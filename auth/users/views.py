@@ -1,12 +1,34 @@
+import hashlib
+from calendar import timegm
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Q
 from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework import mixins, viewsets, response, status, decorators, permissions
-from rest_framework_jwt.serializers import VerifyJSONWebTokenSerializer
 from rest_framework.response import Response
 
+from jwt_utils.revocation import revocations
+from jwt_utils.serializers import VerifyTokenSerializer
+
+from .cache import user_cache
 from .models import User
-from .serializers import UserSerializer, ConfirmEmailSerializer
+from .serializers import UserSerializer, UserBatchSerializer, UserListSerializer
+from .pagination import KeysetPagination
 from .permissions import UserPermissions
-from .tasks import broadcast_registration, send_confirmation_email, on_create
+from .throttling import RateThrottle
+from .tasks import broadcast_registration, request_confirmation_email, on_create
+
+
+def validators(uuid: str, updated_at: datetime) -> Tuple[str, int]:
+    """
+    ETag and Last-Modified (as a timestamp) of a user's representation, which only changes along with `updated_at`.
+    """
+    etag = quote_etag(f'{uuid}-{int(updated_at.timestamp() * 1000000):x}')
+    return etag, timegm(updated_at.utctimetuple())
 
 
 class UserViewSet(mixins.ListModelMixin,
@@ -20,14 +42,65 @@ class UserViewSet(mixins.ListModelMixin,
 
     lookup_field = 'username'
 
+    # public fields of the users resolved by `batch`
+    BATCH_FIELDS = ('uuid', 'username')
+
+    # scope of `create`, the only generic action throttled; other actions set theirs along with throttle_classes
+    throttle_scope = 'signup'
+
     queryset = model_class.objects.all()
+    pagination_class = KeysetPagination
+
+    def get_throttles(self):
+        if self.action == 'create':
+            return [RateThrottle()]
+        return super().get_throttles()
+
+    def get_object(self):
+        # detail routes resolve the user through the cache, rather than `queryset`
+        user = user_cache.get_by_username(self.kwargs[self.lookup_field])
+        if user is None:
+            raise Http404
+
+        self.check_object_permissions(self.request, user)
+        return user
+
+    def conditional_response(self, request, etag: str, last_modified: Optional[int],
+                             render: Callable[[], Response]) -> Response:
+        # answered before serializing, a 304 costs no more than the lookups the validators came from
+        resp = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if resp is None:
+            resp = render()
+
+        resp['ETag'] = etag
+        if last_modified is not None:
+            resp['Last-Modified'] = http_date(last_modified)
+        # revalidated on every use, and never shared: the representation depends on who asks
+        patch_cache_control(resp, private=True, no_cache=True)
+        patch_vary_headers(resp, ('Authorization',))
+        return resp
+
+    def user_response(self, request, user: User) -> Response:
+        etag, last_modified = validators(user.uuid, user.updated_at)
+        return self.conditional_response(request, etag, last_modified, lambda: Response(self.get_serializer(user).data))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.user_response(request, self.get_object())
 
     def list(self, request, *args, **kwargs) -> response.Response:
-        return response.Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        # public fields only, in the order and pages of `KeysetPagination`
+        page = self.paginate_queryset(self.queryset.only('id', *UserListSerializer.Meta.fields))
+        return self.get_paginated_response(UserListSerializer(page, many=True).data)
 
     def perform_create(self, serializer):
-        user = serializer.save()
-        on_create(user)
+        with transaction.atomic():
+            user = serializer.save()
+            on_create(user)
+
+    def perform_destroy(self, instance):
+        # revoked first, a failure leaves the user in place to retry
+        revocations.revoke_user(instance.uuid)
+        instance.delete()
 
     @decorators.action(methods=['get'], detail=False)
     def broadcast_registration(self, request, *args, **kwargs):
@@ -35,7 +108,8 @@ class UserViewSet(mixins.ListModelMixin,
         broadcast_registration(uuid=user.uuid, username=user.username)
         return response.Response(status=status.HTTP_204_NO_CONTENT)
 
-    @decorators.action(methods=['get'], detail=True, permission_classes=(permissions.AllowAny,))
+    @decorators.action(methods=['get'], detail=True, permission_classes=(permissions.AllowAny,),
+                       throttle_classes=(RateThrottle,), throttle_scope='confirmation_email')
     def send_confirmation_email(self, *args, **kwargs):
         # do not provide feedback regarding if the request was actually successful or not
         try:
@@ -44,12 +118,12 @@ class UserViewSet(mixins.ListModelMixin,
             user = None
 
         if user is not None and not user.email_confirmed:
-            send_confirmation_email(user=ConfirmEmailSerializer(user).data)
+            request_confirmation_email(user)
 
         return response.Response(status=status.HTTP_204_NO_CONTENT)
 
     @decorators.action(methods=['post'], detail=False,
-                       permission_classes=(permissions.AllowAny,), serializer_class=VerifyJSONWebTokenSerializer)
+                       permission_classes=(permissions.AllowAny,), serializer_class=VerifyTokenSerializer)
     def confirm_email(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.query_params)
 
@@ -63,6 +137,38 @@ class UserViewSet(mixins.ListModelMixin,
 
     @decorators.action(methods=['get'], detail=False)
     def me(self, request, *args, **kwargs):
-        instance = self.request.user
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        # the token's claims lack `updated_at`, the user is loaded through the cache
+        return self.user_response(request, request.user.instance)
+
+    @decorators.action(methods=['get', 'post'], detail=False, permission_classes=(permissions.IsAuthenticated,),
+                       serializer_class=UserBatchSerializer)
+    def batch(self, request, *args, **kwargs):
+        """
+        Public fields of the users of `uuids` and `usernames`, unknown ones left out, read by a single query.
+
+        Lists are given as a JSON body to POST or comma separated query parameters to GET.
+        """
+        if request.method == 'POST':
+            data = request.data
+        else:
+            data = {
+                field: [value for value in request.query_params[field].split(',') if value]
+                for field in ('uuids', 'usernames') if field in request.query_params
+            }
+
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        uuids, usernames = serializer.validated_data['uuids'], serializer.validated_data['usernames']
+
+        users = list(
+            User.objects
+            .filter(Q(uuid__any=uuids) | Q(username__any=usernames))
+            .order_by('username')
+            .values(*self.BATCH_FIELDS, 'updated_at')
+        )
+
+        # no Last-Modified, a user leaving the batch would not change it
+        etags = ''.join(validators(user['uuid'], user.pop('updated_at'))[0] for user in users)
+        etag = quote_etag(hashlib.sha1(etags.encode()).hexdigest())
+
+        return self.conditional_response(request, etag, None, lambda: Response({'results': users}))
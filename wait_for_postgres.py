@@ -1,14 +1,19 @@
 import os
+import sys
 import logging
 import time
 import psycopg2
 
 
 TIME_OUT = 30  # seconds
-SLEEP_INTERVAL = 2  # seconds
-
-PG_READY = "Postgres is ready!"
-PG_NOT_READY = "Postgres isn't ready. Trying again in {} seconds...".format(SLEEP_INTERVAL)
+# the first retry comes quickly, as postgres is often only a moment away from accepting connections, then
+# each one waits twice as long as the previous one, up to MAX_SLEEP_INTERVAL
+MIN_SLEEP_INTERVAL = 0.05  # seconds
+MAX_SLEEP_INTERVAL = 2  # seconds
+CONNECT_TIMEOUT = 2  # seconds
+
+PG_READY = "Postgres is ready after {:.2f} seconds!"
+PG_NOT_READY = "Postgres isn't ready. Trying again in {:.2f} seconds..."
 PG_NEVER_READY = "Failed to connect to Postgres within {} seconds.".format(TIME_OUT)
 
 DB_CONFIG = {
@@ -24,19 +29,29 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
+
 def pg_is_ready(user, password, host, port, dbname):
-    while time.time() - start_time < TIME_OUT:
+    params = {'user': user, 'password': password, 'host': host, 'port': port, 'dbname': dbname}
+    sleep_interval = MIN_SLEEP_INTERVAL
+
+    while True:
         try:
-            conn = psycopg2.connect(**vars())
-            logger.info(PG_READY)
+            conn = psycopg2.connect(connect_timeout=CONNECT_TIMEOUT, **params)
+            logger.info(PG_READY.format(time.time() - start_time))
             conn.close()
             return True
         except psycopg2.OperationalError:
-            logger.info(PG_NOT_READY)
-            time.sleep(SLEEP_INTERVAL)
+            remaining = start_time + TIME_OUT - time.time()
+            if remaining <= 0:
+                break
+
+            sleep_interval = min(sleep_interval, remaining)
+            logger.info(PG_NOT_READY.format(sleep_interval))
+            time.sleep(sleep_interval)
+            sleep_interval = min(sleep_interval * 2, MAX_SLEEP_INTERVAL)
 
     logger.error(PG_NEVER_READY)
     return False
 
 
-pg_is_ready(**DB_CONFIG)
+sys.exit(0 if pg_is_ready(**DB_CONFIG) else 1)